@@ -1,17 +1,37 @@
 import re
-from openai import OpenAI
+import asyncio
+from openai import AsyncOpenAI
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session, joinedload
 from dotenv import load_dotenv
 import os
 import json
-from db.models import Product as ProductModel, Metal as MetalModel, Lead as LeadModel, SessionLocal
+from typing import NamedTuple
+from db.search import search_product_ids, has_search_index
+from db.models import Product as ProductModel, Metal as MetalModel, Lead as LeadModel, SessionLocal, AsyncSessionLocal, async_db_enabled, insert_missing_leads
 from pydantic import BaseModel
-from send_msg import send_img
+from send_msg import send_img_async
+from lead_cache import lead_cache, CachedLead
+from conversations import ConversationPool
+from catalog import catalog, CatalogSnapshot, CATALOG_SNAPSHOT, CATALOG_INLINE_MAX_ROWS
+from tool_output import encode_tool_output
+from tool_cache import tool_cache, TOOL_CACHE_MAX_BYTES
+from intents import intent_router, INTENT_ROUTER
+from answer_cache import answer_cache
+from retrieval import product_retriever
+from tool_selection import select_tools, estimate_tokens, token_usage
 
 load_dotenv()
 api = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=api)
+client = AsyncOpenAI(api_key=api)
+conversation_pool = ConversationPool(client)
 model = "gpt-5"
+# Product tool results are paged: default / maximum rows per call, and ranked search depth
+TOOL_PAGE_DEFAULT = int(os.getenv("TOOL_PAGE_DEFAULT", 10))
+TOOL_PAGE_MAX = int(os.getenv("TOOL_PAGE_MAX", 50))
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", 200))
+# Function calls returned in one model round run concurrently, up to this many at a time
+TOOL_CALL_CONCURRENCY = max(1, int(os.getenv("TOOL_CALL_CONCURRENCY", 4)))
 
 class Product(BaseModel):
     style_no: str | None = None
@@ -25,9 +45,37 @@ class Product(BaseModel):
 
 class Products(BaseModel):
     products: list[Product]
+    total: int | None = None
+    next_cursor: str | None = None
 
-def _products_to_response(products: list[ProductModel]) -> dict:
-    """Convert DB product rows to Products schema dict."""
+
+PRODUCT_FIELDS = list(Product.model_fields)
+# Long free text is only sent when the model asks for it via `fields`
+DEFAULT_PRODUCT_FIELDS = [f for f in PRODUCT_FIELDS if f != "description"]
+
+
+class Page(NamedTuple):
+    """Paging / projection arguments shared by every product tool."""
+    limit: int = TOOL_PAGE_DEFAULT
+    offset: int = 0
+    fields: tuple[str, ...] = tuple(DEFAULT_PRODUCT_FIELDS)
+
+    @classmethod
+    def from_arguments(cls, arguments: dict) -> "Page":
+        """Build a page from tool arguments, clamping limit to TOOL_PAGE_MAX and ignoring bad cursors."""
+        limit = arguments.get("limit") or TOOL_PAGE_DEFAULT
+        try:
+            offset = max(0, int(arguments.get("cursor") or 0))
+        except (TypeError, ValueError):
+            offset = 0
+        requested = arguments.get("fields") or DEFAULT_PRODUCT_FIELDS
+        fields = tuple(f for f in PRODUCT_FIELDS if f in requested)
+        return cls(max(1, min(int(limit), TOOL_PAGE_MAX)), offset, fields or tuple(DEFAULT_PRODUCT_FIELDS))
+
+
+def _products_to_response(products: list[ProductModel], page: Page | None = None, total: int | None = None) -> dict:
+    """Convert DB product rows to Products schema dict (projected to page.fields, with paging summary)."""
+    page = page or Page()
     products_list = [
         Product(
             style_no=p.style_no,
@@ -41,45 +89,140 @@ def _products_to_response(products: list[ProductModel]) -> dict:
         )
         for p in products
     ]
-    return Products(products=products_list).model_dump()
+    total = len(products_list) if total is None else total
+    next_offset = page.offset + len(products_list)
+    return Products(
+        products=products_list,
+        total=total,
+        next_cursor=str(next_offset) if next_offset < total else None,
+    ).model_dump(include={"products": {"__all__": set(page.fields)}, "total": True, "next_cursor": True})
+
+
+def _paged_response(q, page: Page | None, *order_by) -> dict:
+    """Count the query, then fetch one page of it in a stable order."""
+    page = page or Page()
+    total = q.order_by(None).count()
+    rows = q.order_by(*(order_by or (ProductModel.id,))).offset(page.offset).limit(page.limit).all()
+    return _products_to_response(rows, page, total)
+
+
+def _paged_ids_response(db: Session, ids: list[int], page: Page | None) -> dict:
+    """Page through an already ranked id list."""
+    page = page or Page()
+    return _products_to_response(
+        _products_by_ids(db, ids[page.offset:page.offset + page.limit]), page, len(ids)
+    )
 
 
-def get_all_products(db: Session):
-    """Get all products from the database"""
-    products = db.query(ProductModel).options(joinedload(ProductModel.metal_info)).all()
-    return _products_to_response(products)
+def _capped(ranked: list) -> tuple[list, bool]:
+    """The top SEARCH_MAX_RESULTS of a ranking fetched with one extra, and whether more matched."""
+    return ranked[:SEARCH_MAX_RESULTS], len(ranked) > SEARCH_MAX_RESULTS
 
 
-def get_products_by_name(db: Session, name: str):
-    """Get products whose name contains the given string (case-insensitive)."""
-    q = (
+def get_all_products(db: Session, page: Page | None = None):
+    """Get all products from the database, one page at a time"""
+    q = db.query(ProductModel).options(joinedload(ProductModel.metal_info))
+    return _paged_response(q, page)
+
+
+def _products_by_ids(db: Session, ids: list[int]) -> list[ProductModel]:
+    """Load products by id, keeping the order of `ids` (e.g. search rank)."""
+    if not ids:
+        return []
+    rows = (
         db.query(ProductModel)
         .options(joinedload(ProductModel.metal_info))
-        .filter(ProductModel.name.ilike(f"%{name}%"))
+        .filter(ProductModel.id.in_(ids))
+        .all()
     )
-    return _products_to_response(q.all())
+    by_id = {p.id: p for p in rows}
+    return [by_id[i] for i in ids if i in by_id]
 
 
-def get_products_by_metal(db: Session, metal: str):
+def get_products_by_name(db: Session, name: str, page: Page | None = None):
+    """Get products whose name matches the given words (text index; case-insensitive substring as fallback)."""
+    ids = search_product_ids(db.connection(), name, limit=None, name_only=True)
+    if ids:
+        return _paged_ids_response(db, ids, page)
+    q = (
+        db.query(ProductModel)
+        .options(joinedload(ProductModel.metal_info))
+        .filter(ProductModel.name.ilike(f"%{name}%"))
+    )
+    return _paged_response(q, page)
+
+
+def search_products(db: Session, query: str, page: Page | None = None):
+    """Ranked full-text search over name, description, style_no and jewel_code; returns the top matches."""
+    if has_search_index(db.connection()):
+        ids, capped = _capped(search_product_ids(db.connection(), query, SEARCH_MAX_RESULTS + 1))
+        out = _paged_ids_response(db, ids, page)
+        if capped:
+            # total counts only the top matches; tell the model there are more
+            out["total_capped"] = True
+        return out
+    q = (
+        db.query(ProductModel)
+        .options(joinedload(ProductModel.metal_info))
+        .filter(ProductModel.name.ilike(f"%{query}%"))
+    )
+    return _paged_response(q, page)
+
+
+def find_products(db: Session, query: str, page: Page | None = None):
+    """BM25-ranked products for a loose description (name, description, metal, karat), each with its score."""
+    page = page or Page()
+    ranked, capped = _capped(product_retriever.search(query, SEARCH_MAX_RESULTS + 1))
+    window = ranked[page.offset:page.offset + page.limit]
+    products = _products_by_ids(db, [product_id for product_id, _ in window])
+    out = _products_to_response(products, page, len(ranked))
+    if capped:
+        out["total_capped"] = True
+    scores = dict(window)
+    for row, product in zip(out["products"], products):
+        row["score"] = round(scores[product.id], 3)
+    return out
+
+
+def lookup_product_code(db: Session, code: str, page: Page | None = None):
+    """Product with this style_no / jewel_code, or the nearest codes when it is mistyped (see code_index)."""
+    page = page or Page()
+    # Codes-only index keyed by product id; the page of rows is then read from the DB
+    match, found = catalog.product_code_index().lookup(code, None)
+    window = found[page.offset:page.offset + page.limit]
+    products = _products_by_ids(db, [m.row for m in window])
+    out = _products_to_response(products, page, total=len(found))
+    out["match"] = match
+    by_id = {m.row: m for m in window}
+    for row, product in zip(out["products"], products):
+        row["matched_code"] = by_id[product.id].code
+        row["distance"] = by_id[product.id].distance
+    return out
+
+
+def _metal_ids(db: Session, column, value: str) -> list[int]:
+    """Match against the (tiny) metals table first so products are filtered on the indexed metal_id."""
+    return [m.id for m in db.query(MetalModel.id).filter(column.ilike(f"%{value}%"))]
+
+
+def get_products_by_metal(db: Session, metal: str, page: Page | None = None):
     """Get products by metal type (e.g. Gold, Silver)."""
     q = (
         db.query(ProductModel)
         .options(joinedload(ProductModel.metal_info))
-        .join(ProductModel.metal_info)
-        .filter(MetalModel.metal.ilike(f"%{metal}%"))
+        .filter(ProductModel.metal_id.in_(_metal_ids(db, MetalModel.metal, metal)))
     )
-    return _products_to_response(q.all())
+    return _paged_response(q, page)
 
 
-def get_products_by_metal_karat(db: Session, karat: str):
+def get_products_by_metal_karat(db: Session, karat: str, page: Page | None = None):
     """Get products by metal karat (e.g. 22K, 18K)."""
     q = (
         db.query(ProductModel)
         .options(joinedload(ProductModel.metal_info))
-        .join(ProductModel.metal_info)
-        .filter(MetalModel.karat.ilike(f"%{karat}%"))
+        .filter(ProductModel.metal_id.in_(_metal_ids(db, MetalModel.karat, karat)))
     )
-    return _products_to_response(q.all())
+    return _paged_response(q, page)
 
 
 def get_products_by_price(
@@ -88,15 +231,12 @@ def get_products_by_price(
     min_price: float | None = None,
     max_price: float | None = None,
     exact_price: float | None = None,
+    page: Page | None = None,
 ):
-    """Get products by price (calculated amount). Pass exact_price, or min_price/max_price, or both."""
-    q = (
-        db.query(ProductModel)
-        .options(joinedload(ProductModel.metal_info))
-        .join(ProductModel.metal_info)
-    )
-    # Use SQL expression for calculated amount: gross_weight * rate_per_gram
-    amount = ProductModel.gross_weight * MetalModel.rate_per_gram
+    """Get products by price (calculated amount), cheapest first. Pass exact_price, or min_price/max_price, or both."""
+    q = db.query(ProductModel).options(joinedload(ProductModel.metal_info))
+    # Stored, indexed gross_weight * rate_per_gram: range filters use ix_products_amount
+    amount = ProductModel.amount
     if exact_price is not None:
         q = q.filter(amount.between(exact_price - 0.01, exact_price + 0.01))
     else:
@@ -104,34 +244,48 @@ def get_products_by_price(
             q = q.filter(amount >= min_price)
         if max_price is not None:
             q = q.filter(amount <= max_price)
-    return _products_to_response(q.all())
+    return _paged_response(q, page, ProductModel.amount, ProductModel.id)
 
 
-def get_products_by_availability(db: Session, available: bool):
+def get_products_by_availability(db: Session, available: bool, page: Page | None = None):
     """Get products by availability (boolean column): True = available, False = not available."""
     q = (
         db.query(ProductModel)
         .options(joinedload(ProductModel.metal_info))
         .filter(ProductModel.availability == available)
     )
-    return _products_to_response(q.all())
+    return _paged_response(q, page)
 
 
 # --- Lead extraction from user message ---
 
+_NON_DIGIT_RE = re.compile(r"\D")
+# Sequences of digits, possibly with + prefix or spaces/dashes between digit groups
+_PHONE_RE = re.compile(r"\+?[\d\s\-\.\(\)]{10,}")
+# "name is X", "name: X", "i'm X", "i am X", "my name is X", "this is X"
+_NAME_PATTERNS = [
+    re.compile(p, re.IGNORECASE)
+    for p in (
+        r"(?:name\s+is|name\s*:)\s*([a-zA-Z][a-zA-Z\s]{0,50}?)(?:\s+\d|\s*$|,)",
+        r"(?:i\s*['']?m|i\s+am)\s+([a-zA-Z][a-zA-Z\s]{0,50}?)(?:\s+\d|\s*$|,)",
+        r"(?:my\s+name\s+is)\s+([a-zA-Z][a-zA-Z\s]{0,50}?)(?:\s+\d|\s*$|,)",
+        r"(?:this\s+is)\s+([a-zA-Z][a-zA-Z\s]{0,50}?)(?:\s+\d|\s*$|,)",
+        r"(?:call me|contact)\s+([a-zA-Z][a-zA-Z\s]{0,50}?)(?:\s+\d|\s*$|,)",
+    )
+]
+
+
 def _normalize_phone(s: str) -> str:
     """Return digits only for consistent storage and lookup."""
-    return re.sub(r"\D", "", s)
+    return _NON_DIGIT_RE.sub("", s)
 
 
 def _extract_phone_numbers(text: str) -> list[str]:
     """Extract phone-like numbers from text (10+ digits, optionally with + or spaces/dashes)."""
     if not text or not text.strip():
         return []
-    # Match sequences of digits, possibly with + prefix or spaces/dashes between digit groups
-    raw = re.findall(r"\+?[\d\s\-\.\(\)]{10,}", text)
     normalized = []
-    for s in raw:
+    for s in _PHONE_RE.findall(text):
         n = _normalize_phone(s)
         if len(n) >= 10 and n not in normalized:
             normalized.append(n)
@@ -143,15 +297,8 @@ def _extract_name_from_message(text: str) -> str | None:
     if not text or not text.strip():
         return None
     t = text.strip()
-    # "name is X", "name: X", "i'm X", "i am X", "my name is X", "this is X"
-    for pattern in [
-        r"(?:name\s+is|name\s*:)\s*([a-zA-Z][a-zA-Z\s]{0,50}?)(?:\s+\d|\s*$|,)",
-        r"(?:i\s*['']?m|i\s+am)\s+([a-zA-Z][a-zA-Z\s]{0,50}?)(?:\s+\d|\s*$|,)",
-        r"(?:my\s+name\s+is)\s+([a-zA-Z][a-zA-Z\s]{0,50}?)(?:\s+\d|\s*$|,)",
-        r"(?:this\s+is)\s+([a-zA-Z][a-zA-Z\s]{0,50}?)(?:\s+\d|\s*$|,)",
-        r"(?:call me|contact)\s+([a-zA-Z][a-zA-Z\s]{0,50}?)(?:\s+\d|\s*$|,)",
-    ]:
-        m = re.search(pattern, t, re.IGNORECASE)
+    for pattern in _NAME_PATTERNS:
+        m = pattern.search(t)
         if m:
             name = m.group(1).strip()
             if name and len(name) <= 100:
@@ -163,22 +310,19 @@ def ensure_leads_from_message(db: Session, content: str) -> None:
     """
     If the message contains any phone number that is not in the leads table,
     save it as a new lead. Use extracted name if present, otherwise 'unknown'.
+    All numbers go in one INSERT that ignores existing phones, so duplicate races are harmless.
     """
     phones = _extract_phone_numbers(content)
     if not phones:
         return
     name = _extract_name_from_message(content) or "unknown"
-    for phone in phones:
-        if db.query(LeadModel).filter(LeadModel.phone == phone).first() is not None:
-            continue
-        try:
-            lead = LeadModel(phone=phone, name=name, email=None)
-            db.add(lead)
-            db.commit()
-        except Exception:
-            db.rollback()
-            # e.g. duplicate from race, or DB constraint
-            raise
+    try:
+        insert_missing_leads(db, [{"phone": phone, "name": name, "email": None} for phone in phones])
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        # Lead capture is best effort: never fail the customer's reply over it
+        print(f"Failed to save leads from message: {e!r}")
 
 
 # Tool definitions for the Responses API (function calling)
@@ -186,7 +330,7 @@ PRODUCT_TOOLS = [
     {
         "type": "function",
         "name": "get_all_products",
-        "description": "List all products in the store's database. Use this when the user asks to list, show, or get all products.",
+        "description": "List all products in the store's database, one page at a time (see total / next_cursor in the result). Use this when the user asks to list, show, or get all products.",
         "parameters": {
             "type": "object",
             "properties": {},
@@ -209,6 +353,48 @@ PRODUCT_TOOLS = [
         },
         "strict": True,
     },
+    {
+        "type": "function",
+        "name": "search_products",
+        "description": "Ranked search over product name, description, style number and jewel code. Returns only the top matches, best first (total_capped=true: more products matched than total). Prefer this over get_all_products when the user describes what they want or mentions a code.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "Words, style number or jewel code to search for."},
+            },
+            "required": ["query"],
+            "additionalProperties": False,
+        },
+        "strict": True,
+    },
+    {
+        "type": "function",
+        "name": "lookup_product_code",
+        "description": "Look up a product by style number or jewel code, tolerating spaces, case and small typos. Returns match='exact' with the product, match='nearest' with the closest codes (and their edit distance), or match='none'.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "code": {"type": "string", "description": "Style number or jewel code as the customer wrote it."},
+            },
+            "required": ["code"],
+            "additionalProperties": False,
+        },
+        "strict": True,
+    },
+    {
+        "type": "function",
+        "name": "find_products",
+        "description": "Relevance-ranked retrieval for loose descriptions (e.g. 'thin chain for daily wear', 'heavy bridal necklace') over product name, description, metal and karat. Returns the best matches first, each with a relevance score (total_capped=true: more products matched than total).",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "The customer's description of what they want."},
+            },
+            "required": ["query"],
+            "additionalProperties": False,
+        },
+        "strict": True,
+    },
     {
         "type": "function",
         "name": "get_products_by_metal",
@@ -285,31 +471,247 @@ PRODUCT_TOOLS = [
 ]
 
 
-def _handle_tool_call(db: Session, name: str, arguments: dict, user_phone: str | None = None):
-    """Execute a product tool and return JSON string result."""
+# Every product listing tool takes the same paging / projection arguments (strict mode: all required, nullable)
+PAGING_PROPERTIES = {
+    "limit": {"type": ["integer", "null"], "description": f"Products per page (optional, default {TOOL_PAGE_DEFAULT}, max {TOOL_PAGE_MAX})."},
+    "cursor": {"type": ["string", "null"], "description": "next_cursor from a previous result to get the next page (optional)."},
+    "fields": {
+        "type": ["array", "null"],
+        "items": {"type": "string", "enum": PRODUCT_FIELDS},
+        "description": "Fields to return per product (optional). Default: all except description.",
+    },
+}
+for _tool in PRODUCT_TOOLS:
+    if _tool["name"] != "send_product_image":
+        _tool["parameters"]["properties"].update(PAGING_PROPERTIES)
+        _tool["parameters"]["required"] = _tool["parameters"]["required"] + list(PAGING_PROPERTIES)
+
+# Canonical tool list and order; per-turn subsets are filtered from it (see tool_selection)
+ALL_TOOLS = [{"type": "web_search", "filters": {"allowed_domains": ["ridra.in"]}}] + PRODUCT_TOOLS
+ALL_TOOLS_TOKENS = estimate_tokens(ALL_TOOLS)
+
+
+def _with_session(fn, *args, **kwargs):
+    """Call fn(db, *args, **kwargs) on a short-lived session and close it afterwards."""
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+
+async def _run_db(fn, *args, **kwargs):
+    """Run blocking DB work in a worker thread so the event loop keeps serving other users."""
+    return await asyncio.to_thread(_with_session, fn, *args, **kwargs)
+
+
+def _claim_thread_id(db: Session, lead_id: int, thread_id: str) -> str | None:
+    """
+    Store thread_id unless the lead already has one, and return the lead's thread_id afterwards:
+    ours, or the one a concurrent turn (this process or another) stored first.
+    """
+    db.query(LeadModel).filter(LeadModel.id == lead_id, LeadModel.thread_id.is_(None)).update(
+        {LeadModel.thread_id: thread_id}, synchronize_session=False
+    )
+    db.commit()
+    return db.query(LeadModel.thread_id).filter(LeadModel.id == lead_id).scalar()
+
+
+def _load_lead(db: Session, lead_id: int) -> CachedLead | None:
+    """Fetch a lead's (id, phone, thread_id) for callers that only have the id."""
+    row = db.query(LeadModel.id, LeadModel.phone, LeadModel.thread_id).filter(LeadModel.id == lead_id).first()
+    return CachedLead(row.id, row.phone, row.thread_id) if row else None
+
+
+async def _fetch_lead(lead_id: int) -> CachedLead | None:
+    """_load_lead on the async engine when it is configured, otherwise in a worker thread."""
+    if not async_db_enabled():
+        return await _run_db(_load_lead, lead_id)
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(
+            select(LeadModel.id, LeadModel.phone, LeadModel.thread_id).where(LeadModel.id == lead_id)
+        )).first()
+    return CachedLead(row.id, row.phone, row.thread_id) if row else None
+
+
+async def _store_thread_id(lead_id: int, thread_id: str) -> str | None:
+    """_claim_thread_id on the async engine when it is configured, otherwise in a worker thread."""
+    if not async_db_enabled():
+        return await _run_db(_claim_thread_id, lead_id, thread_id)
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(LeadModel)
+            .where(LeadModel.id == lead_id, LeadModel.thread_id.is_(None))
+            .values(thread_id=thread_id)
+        )
+        await db.commit()
+        return (await db.execute(select(LeadModel.thread_id).where(LeadModel.id == lead_id))).scalar()
+
+
+async def _conversation_for(lead: CachedLead) -> str | None:
+    """
+    The lead's conversation id, creating one if it has none. Queued jobs carry the lead as it was
+    when the message arrived, and another process may have cached it without a conversation, so
+    the id is re-read (this process's cache, then the DB) before a pooled conversation is taken;
+    the conditional store keeps the first conversation if two turns race.
+    """
+    if lead.thread_id:
+        return lead.thread_id
+    cached = lead_cache.get(lead.phone)
+    if cached is not None and cached.thread_id:
+        return cached.thread_id
+    fresh = await _fetch_lead(lead.lead_id)
+    if fresh is None:
+        return None
+    if fresh.thread_id:
+        lead_cache.put(fresh)
+        return fresh.thread_id
+    conversation_id = await conversation_pool.acquire()
+    stored = await _store_thread_id(lead.lead_id, conversation_id)
+    if stored and stored != conversation_id:
+        print(f"Lead {lead.lead_id} got conversation {stored} concurrently; {conversation_id} left unused")
+    if stored:
+        lead_cache.set_thread_id(fresh, stored)
+    return stored
+
+
+async def _append_to_conversation(conversation_id: str | None, content: str, answer: str) -> None:
+    """Record a turn answered without the model, so later turns still see it in the conversation."""
+    if not conversation_id:
+        return
     try:
-        if name == "get_all_products":
-            out = get_all_products(db)
-        elif name == "get_products_by_name":
-            out = get_products_by_name(db, arguments["name"])
-        elif name == "get_products_by_metal":
-            out = get_products_by_metal(db, arguments["metal"])
-        elif name == "get_products_by_metal_karat":
-            out = get_products_by_metal_karat(db, arguments["karat"])
-        elif name == "get_products_by_price":
-            out = get_products_by_price(
-                db,
-                min_price=arguments.get("min_price"),
-                max_price=arguments.get("max_price"),
-                exact_price=arguments.get("exact_price"),
+        await client.conversations.items.create(
+            conversation_id,
+            items=[
+                {"type": "message", "role": "user", "content": content},
+                {"type": "message", "role": "assistant", "content": answer},
+            ],
+        )
+    except Exception as e:
+        print(f"Failed to append turn to conversation {conversation_id}: {e!r}")
+
+
+def _run_product_tool(db: Session, name: str, arguments: dict):
+    """Execute one of the read-only product tools against the DB."""
+    page = Page.from_arguments(arguments)
+    if name == "get_all_products":
+        return get_all_products(db, page)
+    if name == "get_products_by_name":
+        return get_products_by_name(db, arguments["name"], page)
+    if name == "search_products":
+        return search_products(db, arguments["query"], page)
+    if name == "find_products":
+        return find_products(db, arguments["query"], page)
+    if name == "lookup_product_code":
+        return lookup_product_code(db, arguments["code"], page)
+    if name == "get_products_by_metal":
+        return get_products_by_metal(db, arguments["metal"], page)
+    if name == "get_products_by_metal_karat":
+        return get_products_by_metal_karat(db, arguments["karat"], page)
+    if name == "get_products_by_price":
+        return get_products_by_price(
+            db,
+            min_price=arguments.get("min_price"),
+            max_price=arguments.get("max_price"),
+            exact_price=arguments.get("exact_price"),
+            page=page,
+        )
+    if name == "get_products_by_availability":
+        return get_products_by_availability(db, arguments["available"], page)
+    return {"error": f"Unknown tool: {name}"}
+
+
+def _run_snapshot_tool(snapshot: CatalogSnapshot, name: str, arguments: dict) -> dict | None:
+    """Serve a product tool from the in-memory catalog; None if the tool needs the DB (full-text search)."""
+    if name == "get_all_products":
+        indices = snapshot.all()
+    elif name == "get_products_by_name":
+        indices = snapshot.by_name(arguments["name"])
+    elif name == "get_products_by_metal":
+        indices = snapshot.by_metal(arguments["metal"])
+    elif name == "get_products_by_metal_karat":
+        indices = snapshot.by_karat(arguments["karat"])
+    elif name == "get_products_by_price":
+        indices = snapshot.by_price(
+            min_price=arguments.get("min_price"),
+            max_price=arguments.get("max_price"),
+            exact_price=arguments.get("exact_price"),
+        )
+    elif name == "get_products_by_availability":
+        indices = snapshot.by_availability(arguments["available"])
+    elif name == "find_products":
+        page = Page.from_arguments(arguments)
+        found, capped = _capped(product_retriever.search(arguments["query"], SEARCH_MAX_RESULTS + 1))
+        ranked = [
+            (i, score) for i, score in (
+                (snapshot.index_of(product_id), score) for product_id, score in found
             )
-        elif name == "get_products_by_availability":
-            out = get_products_by_availability(db, arguments["available"])
-        elif name == "send_product_image":
+            if i is not None
+        ]
+        out = snapshot.page([i for i, _ in ranked], page.offset, page.limit, page.fields)
+        if capped:
+            out["total_capped"] = True
+        for row, (_, score) in zip(out["products"], ranked[page.offset:]):
+            row["score"] = round(score, 3)
+        return out
+    elif name == "lookup_product_code":
+        page = Page.from_arguments(arguments)
+        match, found = snapshot.code_index.lookup(arguments["code"], None)
+        out = snapshot.page([m.row for m in found], page.offset, page.limit, page.fields)
+        out["match"] = match
+        for row, m in zip(out["products"], found[page.offset:]):
+            row["matched_code"] = m.code
+            row["distance"] = m.distance
+        return out
+    else:
+        return None
+    page = Page.from_arguments(arguments)
+    return snapshot.page(indices, page.offset, page.limit, page.fields)
+
+
+def _tool_cache_key(name: str, arguments: dict) -> tuple:
+    """Tool name + arguments normalized so equivalent calls share an entry (case, key order, defaults)."""
+    filters = tuple(sorted(
+        (k, v.strip().lower() if isinstance(v, str) else v)
+        for k, v in arguments.items()
+        if k not in PAGING_PROPERTIES and v is not None
+    ))
+    return name, filters, Page.from_arguments(arguments)
+
+
+async def _product_tool_output(name: str, arguments: dict) -> str:
+    """Run a read-only product tool (catalog snapshot, else DB) and serialize it, through tool_cache."""
+    use_cache = TOOL_CACHE_MAX_BYTES > 0
+    if use_cache:
+        key = _tool_cache_key(name, arguments)
+        version = catalog.version
+        cached = tool_cache.get(key, version)
+        if cached is not None:
+            return cached
+    out = None
+    if CATALOG_SNAPSHOT:
+        snapshot = catalog.current() or await asyncio.to_thread(catalog.get)
+        if name in ("find_products", "lookup_product_code") or snapshot.size > CATALOG_INLINE_MAX_ROWS:
+            # May first (re)build the retrieval or code index; big catalogs take milliseconds to filter
+            out = await asyncio.to_thread(_run_snapshot_tool, snapshot, name, arguments)
+        else:
+            out = _run_snapshot_tool(snapshot, name, arguments)
+    if out is None:
+        out = await _run_db(_run_product_tool, name, arguments)
+    result = encode_tool_output(out)
+    if use_cache and "error" not in out:
+        tool_cache.put(key, version, result)
+    return result
+
+
+async def _handle_tool_call(name: str, arguments: dict, user_phone: str | None = None):
+    """Execute a product tool and return its result serialized per TOOL_OUTPUT_FORMAT."""
+    try:
+        if name == "send_product_image":
             if not user_phone:
                 out = {"success": False, "error": "User phone number not available"}
             else:
-                response = send_img(
+                response = await send_img_async(
                     user_contact_number=user_phone,
                     link=arguments["image_url"],
                     caption=arguments["caption"]
@@ -319,97 +721,133 @@ def _handle_tool_call(db: Session, name: str, arguments: dict, user_phone: str |
                 else:
                     out = {"success": False, "error": f"Failed to send image: {response.status_code}", "response": response.json()}
         else:
-            out = {"error": f"Unknown tool: {name}"}
-        return json.dumps(out, default=str)
+            return await _product_tool_output(name, arguments)
+        return encode_tool_output(out)
     except Exception as e:
         return json.dumps({"error": str(e)})
 
 
-def chat_with_assistant(lead_id: int | None, content: str) -> str:
-    """Chat with the assistant; product tools are called automatically. Uses conversation in lead.thread_id when lead_id is set."""
-    db = SessionLocal()
-    try:
-        ensure_leads_from_message(db, content)
+async def _run_tool_calls(calls: list, user_phone: str | None) -> list[dict]:
+    """
+    Execute one round's function calls concurrently (at most TOOL_CALL_CONCURRENCY at a time), so the
+    round takes as long as its slowest call. Outputs keep the order of the calls.
+    """
+    semaphore = asyncio.Semaphore(TOOL_CALL_CONCURRENCY)
+
+    async def run(item) -> dict:
+        arguments_raw = getattr(item, "arguments", None) or "{}"
+        try:
+            arguments = json.loads(arguments_raw) if isinstance(arguments_raw, str) else arguments_raw
+        except json.JSONDecodeError:
+            arguments = {}
+        async with semaphore:
+            result = await _handle_tool_call(getattr(item, "name", None), arguments, user_phone)
+        return {
+            "type": "function_call_output",
+            "call_id": getattr(item, "call_id", None),
+            "output": result,
+        }
 
-        # Get user phone from lead
-        user_phone: str | None = None
-        if lead_id is not None:
-            lead = db.query(LeadModel).filter(LeadModel.id == lead_id).first()
+    return list(await asyncio.gather(*(run(item) for item in calls)))
+
+
+def _record_token_usage(groups: tuple[str, ...], rounds: int, schema_tokens: int, input_tokens: int, cached_tokens: int) -> None:
+    """Tool-schema tokens sent this turn vs what the full tool list would have cost, plus reported usage."""
+    full, sent = ALL_TOOLS_TOKENS * rounds, schema_tokens * rounds
+    token_usage.record(groups, full, sent, input_tokens, cached_tokens)
+    print(
+        f"Turn tools {'+'.join(groups) or 'all'}: ~{sent}/{full} schema tokens, "
+        f"input_tokens={input_tokens} (cached {cached_tokens}) over {rounds} round(s)"
+    )
+
+
+async def chat_with_assistant(lead: CachedLead | int | None, content: str) -> str:
+    """
+    Chat with the assistant; product tools are called automatically. Uses the conversation in
+    lead.thread_id when a lead is given (a CachedLead from the webhook, or a bare lead id).
+    Formulaic catalog questions are answered by the intent router, and repeats of recently
+    answered questions by answer_cache, without calling the model.
+    """
+    await _run_db(ensure_leads_from_message, content)
+
+    if isinstance(lead, int):
+        lead = await _fetch_lead(lead)
+    user_phone: str | None = lead.phone if lead else None
+    if INTENT_ROUTER:
+        reply = await intent_router.route(content, user_phone)
+        if reply is not None:
             if lead:
-                user_phone = lead.phone
-
-        developer_instruction = (
-            "You are a helpful store assistant. You have access to this store's product database. "
-            "When the user asks to list, show, or get products (e.g. 'list me all the products'), use the get_all_products tool to fetch data from the database, then summarize the results for the user. "
-            "You can also search by name, metal, karat, price, or availability using the other product tools. "
-            "When a user asks to see an image or photo of a product, use the send_product_image tool with the product's image_url and create a descriptive caption including the product name and price. "
-            "Reply in a friendly, concise way. Do not ask which brand or store—you are this store's assistant."
-        )
-        tools = [{"type": "web_search", "filters": {"allowed_domains": ["ridra.in"]}}] + PRODUCT_TOOLS
-
-        # Resolve conversation id from lead (Responses API conversation stored in thread_id)
-        conversation_id: str | None = None
-        if lead_id is not None:
-            lead = db.query(LeadModel).filter(LeadModel.id == lead_id).first()
-            if lead and lead.thread_id:
-                conversation_id = lead.thread_id
-            elif lead:
-                # Old lead without thread_id: create conversation and persist
-                new_conv = client.conversations.create()
-                conversation_id = new_conv.id
-                lead.thread_id = new_conv.id
-                db.commit()
-
-        # With conversation: pass only new user message; API prepends conversation history.
-        # Without: build full input list so tool-call rounds keep context.
+                await _append_to_conversation(await _conversation_for(lead), content, reply)
+            return reply
+    catalog_version = catalog.version
+    cached = answer_cache.get(content, catalog_version)
+    if cached is not None:
+        answer, score = cached
+        print(f"Answer cache hit (similarity {score:.2f}) for lead {lead.lead_id if lead else None}: {content!r}")
+        if lead:
+            await _append_to_conversation(await _conversation_for(lead), content, answer)
+        return answer
+    # New or old lead without thread_id: takes a pre-warmed conversation and persists it
+    conversation_id: str | None = await _conversation_for(lead) if lead else None
+
+    developer_instruction = (
+        "You are a helpful store assistant. You have access to this store's product database. "
+        "When the user asks to list, show, or get products (e.g. 'list me all the products'), use the get_all_products tool to fetch data from the database, then summarize the results for the user. "
+        "Product tools return one page of results with a total count; only request the next page (cursor) or extra fields (e.g. description) when you need them. "
+        "You can also search by name, metal, karat, price, or availability using the other product tools, use find_products when the customer describes the kind of piece they want, lookup_product_code when they give a style number or jewel code, and search_products for other free-text searches. "
+        "When a user asks to see an image or photo of a product, use the send_product_image tool with the product's image_url and create a descriptive caption including the product name and price. "
+        "Reply in a friendly, concise way. Do not ask which brand or store—you are this store's assistant."
+    )
+    # Only the tools this message can need, in canonical order; the instruction stays identical
+    tools, tool_groups = select_tools(ALL_TOOLS, content)
+    sent_schema_tokens = ALL_TOOLS_TOKENS if tools is ALL_TOOLS else estimate_tokens(tools)
+
+    # With conversation: pass only new user message; API prepends conversation history.
+    # Without: build full input list so tool-call rounds keep context.
+    if conversation_id:
+        input_list = [{"role": "user", "content": content}]
+    else:
+        input_list = [
+            {"role": "developer", "content": developer_instruction},
+            {"role": "user", "content": content},
+        ]
+    create_kw: dict = {
+        "model": model,
+        "instructions": developer_instruction if conversation_id else None,
+        "input": input_list,
+        "tools": tools,
+    }
+    if conversation_id:
+        create_kw["conversation"] = conversation_id
+    if create_kw["instructions"] is None:
+        del create_kw["instructions"]
+
+    max_rounds = 5
+    resp = None
+    sent_images = False
+    rounds = input_tokens = cached_tokens = 0
+    for _ in range(max_rounds):
+        resp = await client.responses.create(**create_kw)
+        rounds += 1
+        usage = getattr(resp, "usage", None)
+        if usage is not None:
+            input_tokens += usage.input_tokens or 0
+            details = getattr(usage, "input_tokens_details", None)
+            cached_tokens += (getattr(details, "cached_tokens", 0) or 0) if details else 0
+        calls = [item for item in resp.output if getattr(item, "type", None) == "function_call"]
+        if not calls:
+            _record_token_usage(tool_groups, rounds, sent_schema_tokens, input_tokens, cached_tokens)
+            answer = resp.output_text or ""
+            if not sent_images:
+                answer_cache.put(content, catalog_version, answer)
+            return answer
+        # A cached answer would not re-send the image, so such turns are not cached
+        sent_images = sent_images or any(getattr(c, "name", None) == "send_product_image" for c in calls)
+        tool_outputs = await _run_tool_calls(calls, user_phone)
         if conversation_id:
-            input_list = [{"role": "user", "content": content}]
+            create_kw["input"] = tool_outputs
         else:
-            input_list = [
-                {"role": "developer", "content": developer_instruction},
-                {"role": "user", "content": content},
-            ]
-        create_kw: dict = {
-            "model": model,
-            "instructions": developer_instruction if conversation_id else None,
-            "input": input_list,
-            "tools": tools,
-        }
-        if conversation_id:
-            create_kw["conversation"] = conversation_id
-        if create_kw["instructions"] is None:
-            del create_kw["instructions"]
-
-        max_rounds = 5
-        resp = None
-        for _ in range(max_rounds):
-            resp = client.responses.create(**create_kw)
-            has_tool_call = False
-            tool_outputs = []
-            for item in resp.output:
-                if getattr(item, "type", None) != "function_call":
-                    continue
-                has_tool_call = True
-                name = getattr(item, "name", None)
-                call_id = getattr(item, "call_id", None)
-                arguments_raw = getattr(item, "arguments", None) or "{}"
-                try:
-                    arguments = json.loads(arguments_raw) if isinstance(arguments_raw, str) else arguments_raw
-                except json.JSONDecodeError:
-                    arguments = {}
-                result = _handle_tool_call(db, name, arguments, user_phone)
-                tool_outputs.append({
-                    "type": "function_call_output",
-                    "call_id": call_id,
-                    "output": result,
-                })
-            if not has_tool_call:
-                return resp.output_text or ""
-            if conversation_id:
-                create_kw["input"] = tool_outputs
-            else:
-                create_kw["input"] = input_list + list(resp.output) + tool_outputs
-                input_list = create_kw["input"]
-        return (resp.output_text or "") if resp else ""
-    finally:
-        db.close()
+            create_kw["input"] = input_list + list(resp.output) + tool_outputs
+            input_list = create_kw["input"]
+    _record_token_usage(tool_groups, rounds, sent_schema_tokens, input_tokens, cached_tokens)
+    return (resp.output_text or "") if resp else ""
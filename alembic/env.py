@@ -12,8 +12,9 @@ from db.models import Base, DATABASE_URL
 # access to the values within the .ini file in use.
 config = context.config
 
-# Override sqlalchemy.url with app's database URL (single source of truth)
-config.set_main_option("sqlalchemy.url", DATABASE_URL)
+# Override sqlalchemy.url with app's database URL (single source of truth, DATABASE_URL env var).
+# "%" is escaped because the ini parser would treat it as interpolation (e.g. in passwords).
+config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
@@ -0,0 +1,41 @@
+"""add processed_messages for webhook deduplication
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "005"
+down_revision: Union[str, Sequence[str], None] = "004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create processed_messages table."""
+    # Already there when the app's create_all ran first (databases stamped at 004)
+    if sa.inspect(op.get_bind()).has_table("processed_messages"):
+        return
+    op.create_table(
+        "processed_messages",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("message_id", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_processed_messages_id"), "processed_messages", ["id"], unique=False)
+    op.create_index(op.f("ix_processed_messages_message_id"), "processed_messages", ["message_id"], unique=True)
+    op.create_index(op.f("ix_processed_messages_created_at"), "processed_messages", ["created_at"], unique=False)
+
+
+def downgrade() -> None:
+    """Drop processed_messages table."""
+    op.drop_index(op.f("ix_processed_messages_created_at"), table_name="processed_messages")
+    op.drop_index(op.f("ix_processed_messages_message_id"), table_name="processed_messages")
+    op.drop_index(op.f("ix_processed_messages_id"), table_name="processed_messages")
+    op.drop_table("processed_messages")
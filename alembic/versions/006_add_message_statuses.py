@@ -0,0 +1,47 @@
+"""add message_statuses for webhook delivery receipts
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "006"
+down_revision: Union[str, Sequence[str], None] = "005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create message_statuses table."""
+    # Already there when the app's create_all ran first (databases stamped at 004)
+    if sa.inspect(op.get_bind()).has_table("message_statuses"):
+        return
+    op.create_table(
+        "message_statuses",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("message_id", sa.String(), nullable=False),
+        sa.Column("recipient_id", sa.String(), nullable=True),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("status_at", sa.DateTime(), nullable=True),
+        sa.Column("errors", sa.JSON(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_message_statuses_id"), "message_statuses", ["id"], unique=False)
+    op.create_index(op.f("ix_message_statuses_message_id"), "message_statuses", ["message_id"], unique=False)
+    op.create_index(op.f("ix_message_statuses_recipient_id"), "message_statuses", ["recipient_id"], unique=False)
+    op.create_index(op.f("ix_message_statuses_status"), "message_statuses", ["status"], unique=False)
+
+
+def downgrade() -> None:
+    """Drop message_statuses table."""
+    op.drop_index(op.f("ix_message_statuses_status"), table_name="message_statuses")
+    op.drop_index(op.f("ix_message_statuses_recipient_id"), table_name="message_statuses")
+    op.drop_index(op.f("ix_message_statuses_message_id"), table_name="message_statuses")
+    op.drop_index(op.f("ix_message_statuses_id"), table_name="message_statuses")
+    op.drop_table("message_statuses")
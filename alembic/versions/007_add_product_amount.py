@@ -0,0 +1,39 @@
+"""add indexed products.amount (gross_weight * rate_per_gram)
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "007"
+down_revision: Union[str, Sequence[str], None] = "006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add amount column, backfill it from the metal rates and index it."""
+    # The app's startup (db.models.ensure_product_amount) may already have added it
+    columns = {c["name"] for c in sa.inspect(op.get_bind()).get_columns("products")}
+    if "amount" in columns:
+        return
+    op.add_column("products", sa.Column("amount", sa.Float(), nullable=True))
+    op.execute(
+        """
+        UPDATE products SET amount = ROUND(COALESCE(gross_weight * (
+            SELECT metals.rate_per_gram FROM metals WHERE metals.id = products.metal_id
+        ), 0.0), 2)
+        """
+    )
+    op.create_index(op.f("ix_products_amount"), "products", ["amount"], unique=False)
+
+
+def downgrade() -> None:
+    """Drop amount column."""
+    op.drop_index(op.f("ix_products_amount"), table_name="products")
+    op.drop_column("products", "amount")
@@ -0,0 +1,82 @@
+"""add full-text product search index
+
+SQLite: FTS5 table products_fts (external content) with sync triggers.
+Postgres: GIN tsvector expression index and trigram index on name.
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "008"
+down_revision: Union[str, Sequence[str], None] = "007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PG_TSVECTOR = (
+    "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(description, '') || ' ' || "
+    "coalesce(style_no, '') || ' ' || coalesce(jewel_code, ''))"
+)
+
+
+def upgrade() -> None:
+    """Create the search index for the current dialect and fill it."""
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        op.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                name, description, style_no, jewel_code,
+                content='products', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+            """
+        )
+        op.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+                INSERT INTO products_fts(rowid, name, description, style_no, jewel_code)
+                VALUES (new.id, new.name, new.description, new.style_no, new.jewel_code);
+            END
+            """
+        )
+        op.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+                INSERT INTO products_fts(products_fts, rowid, name, description, style_no, jewel_code)
+                VALUES ('delete', old.id, old.name, old.description, old.style_no, old.jewel_code);
+            END
+            """
+        )
+        op.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description, style_no, jewel_code ON products BEGIN
+                INSERT INTO products_fts(products_fts, rowid, name, description, style_no, jewel_code)
+                VALUES ('delete', old.id, old.name, old.description, old.style_no, old.jewel_code);
+                INSERT INTO products_fts(rowid, name, description, style_no, jewel_code)
+                VALUES (new.id, new.name, new.description, new.style_no, new.jewel_code);
+            END
+            """
+        )
+        op.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+    elif dialect == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(f"CREATE INDEX IF NOT EXISTS ix_products_search_tsv ON products USING GIN ({PG_TSVECTOR})")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING GIN (name gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    """Drop the search index."""
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        op.execute("DROP TRIGGER IF EXISTS products_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS products_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS products_fts_ai")
+        op.execute("DROP TABLE IF EXISTS products_fts")
+    elif dialect == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_products_name_trgm")
+        op.execute("DROP INDEX IF EXISTS ix_products_search_tsv")
@@ -0,0 +1,167 @@
+"""
+Cache of assistant answers for repeated customer questions.
+
+Questions are normalized (lower case, filler words dropped, plural "s" stripped)
+and compared with a local similarity: the mean of word-set and character-trigram
+Jaccard scores. No embedding service is involved. Numbers must match exactly, so
+"18K rings" never answers "22K rings". Entries belong to one catalog version (a
+product or metal-rate change empties the cache) and expire after ANSWER_CACHE_TTL.
+Only store questions (returns, delivery, timings, address: the tool_selection
+"store" group) are cached, since their answer is the same for every customer;
+catalog answers lean on what the customer said before. Questions that point back
+into the conversation ("the second one", "that") or carry personal details are
+neither stored nor served.
+"""
+import os
+import re
+import threading
+import time
+from typing import NamedTuple
+
+from dotenv import load_dotenv
+
+from tool_selection import select_tool_names
+
+load_dotenv()
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 1000))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.85))
+# Too few content words ("yes", "ok thanks") means the question depends on context
+ANSWER_CACHE_MIN_WORDS = int(os.getenv("ANSWER_CACHE_MIN_WORDS", 2))
+
+_WORD_RE = re.compile(r"\w+")
+_FILLER_WORDS = {
+    "a", "an", "the", "is", "are", "am", "do", "does", "you", "your", "u", "ur", "i", "we",
+    "have", "has", "any", "some", "please", "pls", "plz", "hi", "hello", "hey", "can", "could",
+    "would", "me", "to", "of", "for", "in", "on", "with", "what", "whats", "s", "there", "tell",
+    "know", "want", "need", "show", "get", "sir", "madam", "mam", "ji", "ok", "okay", "thanks",
+}
+# Words that point back into the conversation; such questions are not cacheable
+_CONTEXT_WORDS = {
+    "it", "its", "this", "that", "these", "those", "them", "they", "one", "ones", "first",
+    "second", "third", "last", "previous", "above", "same", "again", "more", "another", "else",
+    "my", "mine", "order", "name", "email", "phone", "number",
+}
+
+
+class Question(NamedTuple):
+    words: frozenset[str]
+    numbers: frozenset[str]
+    trigrams: frozenset[str]
+
+
+def normalize(question: str) -> Question | None:
+    """Comparable form of a question, or None if it should not be cached."""
+    tokens = _WORD_RE.findall((question or "").lower())
+    if any(t in _CONTEXT_WORDS for t in tokens):
+        return None
+    if select_tool_names(question)[1] != ("store",):
+        return None
+    words = []
+    for t in tokens:
+        if t in _FILLER_WORDS:
+            continue
+        if len(t) > 3 and t.endswith("s") and not t.endswith("ss"):
+            t = t[:-1]
+        words.append(t)
+    numbers = frozenset(w for w in words if any(ch.isdigit() for ch in w))
+    # Long digit runs are phone numbers or order ids: personal, never shared
+    if len(words) < ANSWER_CACHE_MIN_WORDS or any(sum(ch.isdigit() for ch in n) >= 7 for n in numbers):
+        return None
+    text = " ".join(sorted(words))
+    trigrams = frozenset(text[i:i + 3] for i in range(len(text) - 2))
+    return Question(frozenset(words), numbers, trigrams)
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def similarity(a: Question, b: Question) -> float:
+    if a.numbers != b.numbers:
+        return 0.0
+    return (_jaccard(a.words, b.words) + _jaccard(a.trigrams, b.trigrams)) / 2
+
+
+class AnswerCache:
+    """Bounded list of (question, answer) for the current catalog version; best match above threshold wins."""
+
+    def __init__(
+        self,
+        maxsize: int = ANSWER_CACHE_SIZE,
+        ttl: float = ANSWER_CACHE_TTL,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.version: int | None = None
+        # Insertion order doubles as age order for eviction
+        self._entries: dict[Question, tuple[float, str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.stores = 0
+
+    def _check_version(self, version: int) -> None:
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+
+    def get(self, question: str, version: int) -> tuple[str, float] | None:
+        """(answer, similarity) of the closest cached question, or None."""
+        if self.maxsize <= 0:
+            return None
+        q = normalize(question)
+        if q is None:
+            self.skipped += 1
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            best, best_score = None, self.threshold
+            for key, (expires, answer) in list(self._entries.items()):
+                if expires < now:
+                    del self._entries[key]
+                    continue
+                score = similarity(q, key)
+                if score >= best_score:
+                    best, best_score = answer, score
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return best, best_score
+
+    def put(self, question: str, version: int, answer: str) -> None:
+        if self.maxsize <= 0 or not answer:
+            return
+        q = normalize(question)
+        if q is None:
+            return
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries.pop(q, None)
+            self._entries[q] = (time.monotonic() + self.ttl, answer)
+            self.stores += 1
+            while len(self._entries) > self.maxsize:
+                del self._entries[next(iter(self._entries))]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxsize": self.maxsize,
+            "catalog_version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_cacheable": self.skipped,
+            "stores": self.stores,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+answer_cache = AnswerCache()
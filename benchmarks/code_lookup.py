@@ -0,0 +1,112 @@
+"""
+Code-lookup benchmark on a synthetic catalog (100k products by default).
+
+Builds the typo-tolerant CodeIndex over style numbers and jewel codes, then looks
+up exact codes, codes with formatting noise (case, spaces, dashes) and codes with
+one or two typos (substitution, insertion, deletion, adjacent swap). Reports build
+time, per-lookup latency and how often the intended product is returned first or
+in the top five, next to a brute-force edit-distance scan over every code.
+
+Usage: python -m benchmarks.code_lookup [--products 100000] [--queries 2000]
+"""
+import argparse
+import random
+import statistics
+import string
+import time
+
+from code_index import CodeIndex, edit_distance, normalize_code
+
+
+def synthetic_codes(products: int, rng: random.Random) -> dict[str, list[int]]:
+    codes: dict[str, list[int]] = {}
+    for row in range(products):
+        codes.setdefault(f"RD{100000 + row}", []).append(row)
+        prefix = "".join(rng.choices(string.ascii_uppercase, k=2))
+        codes.setdefault(f"{prefix}{rng.randint(10000, 99999)}", []).append(row)
+    return codes
+
+
+def typo(code: str, edits: int, rng: random.Random) -> str:
+    chars = list(code)
+    for _ in range(edits):
+        i = rng.randrange(len(chars))
+        kind = rng.choice(("substitute", "insert", "delete", "swap"))
+        if kind == "substitute":
+            chars[i] = rng.choice(string.digits if chars[i].isdigit() else string.ascii_uppercase)
+        elif kind == "insert":
+            chars.insert(i, rng.choice(string.digits))
+        elif kind == "delete" and len(chars) > 4:
+            del chars[i]
+        elif i + 1 < len(chars):
+            chars[i], chars[i + 1] = chars[i + 1], chars[i]
+    return "".join(chars)
+
+
+def noisy(code: str, rng: random.Random) -> str:
+    split = rng.randrange(1, len(code))
+    return f"{code[:split].lower()}{rng.choice([' ', '-', ' - '])}{code[split:]}"
+
+
+def run(index: CodeIndex, codes: dict[str, list[int]], queries: list[tuple[str, int]]) -> dict:
+    """Top-1 / top-5 hit rate on queries that are not themselves another product's code."""
+    latencies, first, top5, collisions = [], 0, 0, 0
+    for query, expected in queries:
+        start = time.perf_counter()
+        _, matches = index.lookup(query)
+        latencies.append((time.perf_counter() - start) * 1e6)
+        if expected not in codes.get(normalize_code(query), [expected]):
+            # The typo spelled a different, existing code: no lookup can tell
+            collisions += 1
+            continue
+        rows = [m.row for m in matches]
+        first += bool(rows) and rows[0] == expected
+        top5 += expected in rows
+    latencies.sort()
+    judged = len(queries) - collisions
+    return {
+        "queries": len(queries),
+        "typo_is_other_code": collisions,
+        "top1": round(first / judged, 3) if judged else None,
+        "top5": round(top5 / judged, 3) if judged else None,
+        "p50_us": round(statistics.median(latencies), 1),
+        "p95_us": round(latencies[int(len(latencies) * 0.95)], 1),
+    }
+
+
+def brute_force(codes: dict[str, list[int]], queries: list[tuple[str, int]], max_distance: int) -> dict:
+    start = time.perf_counter()
+    for query, _ in queries:
+        q = normalize_code(query)
+        min((edit_distance(q, c, max_distance), c) for c in codes)
+    elapsed = time.perf_counter() - start
+    return {"queries": len(queries), "ms_per_lookup": round(elapsed / len(queries) * 1000, 1)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--brute-force-queries", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    codes = synthetic_codes(args.products, rng)
+    start = time.perf_counter()
+    index = CodeIndex(codes)
+    print({"codes": len(codes), "build_seconds": round(time.perf_counter() - start, 2)})
+
+    sample = rng.sample(list(codes.items()), args.queries)
+    cases = {
+        "exact": [(code, rows[0]) for code, rows in sample],
+        "formatting": [(noisy(code, rng), rows[0]) for code, rows in sample],
+        "1 typo": [(typo(code, 1, rng), rows[0]) for code, rows in sample],
+        "2 typos": [(typo(code, 2, rng), rows[0]) for code, rows in sample],
+    }
+    for name, queries in cases.items():
+        print(name, run(index, codes, queries))
+    print("brute force, 1 typo", brute_force(codes, cases["1 typo"][:args.brute_force_queries], index.max_distance))
+
+
+if __name__ == "__main__":
+    main()
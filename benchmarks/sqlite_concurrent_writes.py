@@ -0,0 +1,80 @@
+"""
+Concurrent-writer benchmark: default SQLite settings vs the production profile.
+
+Several threads insert leads and update thread_id (the webhook's write pattern),
+each write in its own transaction, against a throwaway database file.
+
+Usage: python -m benchmarks.sqlite_concurrent_writes [--threads 8] [--writes 300]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from db.models import Base, Lead, enable_sqlite_profile
+
+
+def run(profile: bool, threads: int, writes: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", pool_size=threads)
+        if profile:
+            enable_sqlite_profile(engine)
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+        errors = 0
+        lock = threading.Lock()
+
+        def writer(worker: int) -> None:
+            nonlocal errors
+            db = Session()
+            try:
+                for i in range(writes):
+                    phone = f"9{worker:03d}{i:07d}"
+                    try:
+                        lead = Lead(phone=phone, name=f"bench {worker}")
+                        db.add(lead)
+                        db.commit()
+                        lead.thread_id = f"conv_{phone}"
+                        db.commit()
+                    except OperationalError:
+                        db.rollback()
+                        with lock:
+                            errors += 1
+            finally:
+                db.close()
+
+        workers = [threading.Thread(target=writer, args=(w,)) for w in range(threads)]
+        start = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - start
+        engine.dispose()
+
+    transactions = threads * writes * 2
+    return {
+        "profile": "production" if profile else "default",
+        "seconds": round(elapsed, 3),
+        "tx_per_second": round((transactions - errors) / elapsed, 1),
+        "locked_errors": errors,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=300, help="lead inserts per thread")
+    args = parser.parse_args()
+
+    for profile in (False, True):
+        print(run(profile, args.threads, args.writes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Tool-output benchmark: JSON vs the compact table encoding.
+
+Encodes synthetic product pages (the shape product tools return) both ways and
+reports serialization time and size in tokens. Tokens are counted with tiktoken
+(o200k_base) when it is installed, otherwise estimated as characters / 4.
+
+Usage: python -m benchmarks.tool_output_format [--rows 10 50] [--repeat 2000]
+"""
+import argparse
+import random
+import time
+
+from tool_output import encode_tool_output
+
+METALS = ["Gold - 22K", "Gold - 18K", "Silver - 925", "Platinum - 950"]
+WORDS = ["ring", "bangle", "necklace", "earring", "chain", "pendant", "rose", "classic", "bridal", "floral"]
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("o200k_base")
+
+    def count_tokens(text: str) -> int:
+        return len(_encoding.encode(text))
+
+    TOKENIZER = "tiktoken o200k_base"
+except ImportError:
+    def count_tokens(text: str) -> int:
+        return (len(text) + 3) // 4
+
+    TOKENIZER = "estimate (chars / 4)"
+
+
+def product_page(rows: int, with_description: bool) -> dict:
+    rng = random.Random(rows)
+    products = []
+    for i in range(rows):
+        weight = round(rng.uniform(1, 60), 3)
+        product = {
+            "style_no": f"RD{1000 + i}",
+            "jewel_code": f"JC-{rng.randint(10000, 99999)}",
+            "name": " ".join(rng.sample(WORDS, 3)).title(),
+            "gross_weight": weight,
+            "image_url": f"https://cdn.example.com/products/RD{1000 + i}.jpg" if rng.random() < 0.8 else None,
+            "metal_info": rng.choice(METALS),
+            "calculated_amount": weight * rng.uniform(80, 7000),
+        }
+        if with_description:
+            product["description"] = f"Handcrafted {product['name'].lower()} with a polished finish." if rng.random() < 0.6 else None
+        products.append(product)
+    return {"products": products, "total": rows * 7, "next_cursor": str(rows)}
+
+
+def run(rows: int, with_description: bool, repeat: int) -> list[dict]:
+    page = product_page(rows, with_description)
+    results = []
+    for output_format in ("json", "compact"):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            text = encode_tool_output(page, output_format)
+        elapsed = time.perf_counter() - start
+        results.append({
+            "format": output_format,
+            "rows": rows,
+            "description": with_description,
+            "us_per_call": round(elapsed / repeat * 1e6, 1),
+            "chars": len(text),
+            "tokens": count_tokens(text),
+        })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"tokenizer: {TOKENIZER}")
+    for rows in args.rows:
+        for with_description in (False, True):
+            json_result, compact_result = run(rows, with_description, args.repeat)
+            print(json_result)
+            print(compact_result, f"tokens saved: {1 - compact_result['tokens'] / json_result['tokens']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
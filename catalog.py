@@ -0,0 +1,317 @@
+"""
+In-process snapshot of the product catalog (products joined with metals).
+
+The catalog changes rarely (admin edits), but the assistant's product tools are
+called on almost every turn. The snapshot holds one column list per field plus
+a few precomputed indexes (by metal, by availability, sorted by price), so the
+name / metal / karat / price / availability filters run in memory without a DB
+round trip. Commits that touch Product or Metal rows bump the version and the
+next access reloads; CATALOG_MAX_AGE bounds staleness across processes.
+"""
+import bisect
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from code_index import CodeIndex, normalize_code
+from db.models import Metal, Product, SessionLocal
+
+load_dotenv()
+
+CATALOG_SNAPSHOT = os.getenv("CATALOG_SNAPSHOT", "1") == "1"
+CATALOG_MAX_AGE = float(os.getenv("CATALOG_MAX_AGE", 300))
+# Snapshots up to this many products are filtered on the event loop; larger ones in a worker thread
+CATALOG_INLINE_MAX_ROWS = int(os.getenv("CATALOG_INLINE_MAX_ROWS", 10000))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def add_codes(codes: dict[str, list[int]], row: int, *values: str | None) -> None:
+    """Index `row` under each of its normalized codes (style_no, jewel_code), once per code."""
+    for code in values:
+        if code:
+            code_rows = codes.setdefault(normalize_code(code), [])
+            if not code_rows or code_rows[-1] != row:
+                code_rows.append(row)
+
+
+COLUMNS = (
+    "style_no", "jewel_code", "name", "gross_weight", "image_url",
+    "metal_info", "calculated_amount", "description",
+)
+
+
+class CatalogSnapshot:
+    """Immutable, column-oriented copy of the catalog at one version."""
+
+    def __init__(self, version: int, rows: list, metals: list):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.size = len(rows)
+        self.ids = [r.id for r in rows]
+        self._positions = {product_id: i for i, product_id in enumerate(self.ids)}
+        self.columns: dict[str, list] = {c: [] for c in COLUMNS}
+        # Name word -> rows, and the sorted vocabulary for prefix lookups
+        self._word_rows: dict[str, list[int]] = {}
+        name_lcs: list[str] = []
+        self._by_metal: dict[int, list[int]] = {}
+        self.available: list[bool] = []
+        self._available: list[int] = []
+        self._unavailable: list[int] = []
+        # style_no is not unique: a code can name several products
+        self._codes: dict[str, list[int]] = {}
+        self._code_index: CodeIndex | None = None
+        self._metals = [(m.id, (m.metal or "").lower(), (m.karat or "").lower()) for m in metals]
+        self.metal_rates = [(m.metal, m.karat, m.rate_per_gram) for m in metals]
+        rates = {m.id: m.rate_per_gram for m in metals}
+        labels = {m.id: str(m) for m in metals}
+
+        for i, r in enumerate(rows):
+            amount = r.amount
+            if amount is None:
+                rate = rates.get(r.metal_id)
+                amount = round(r.gross_weight * rate, 2) if r.gross_weight and rate else 0.0
+            self.columns["style_no"].append(r.style_no)
+            self.columns["jewel_code"].append(r.jewel_code)
+            self.columns["name"].append(r.name)
+            self.columns["gross_weight"].append(r.gross_weight)
+            self.columns["image_url"].append(r.image_url)
+            self.columns["metal_info"].append(labels.get(r.metal_id))
+            self.columns["calculated_amount"].append(amount)
+            self.columns["description"].append(r.description)
+            name_lc = (r.name or "").lower()
+            name_lcs.append(name_lc)
+            for word in dict.fromkeys(_TOKEN_RE.findall(name_lc)):
+                self._word_rows.setdefault(word, []).append(i)
+            self._by_metal.setdefault(r.metal_id, []).append(i)
+            self.available.append(bool(r.availability))
+            (self._available if r.availability else self._unavailable).append(i)
+            add_codes(self._codes, i, r.style_no, r.jewel_code)
+
+        self._vocabulary = sorted(self._word_rows)
+        # All names in one string for the substring fallback; _name_starts maps offsets back to rows
+        self._names = "\n".join(name_lcs)
+        self._name_starts = []
+        offset = 0
+        for name_lc in name_lcs:
+            self._name_starts.append(offset)
+            offset += len(name_lc) + 1
+
+        amounts = self.columns["calculated_amount"]
+        self._price_order = sorted(range(self.size), key=lambda i: (amounts[i], self.ids[i]))
+        self._price_keys = [amounts[i] for i in self._price_order]
+
+    # --- filters: each returns row indices in the same order the SQL path would ---
+
+    def all(self) -> list[int]:
+        return list(range(self.size))
+
+    def by_name(self, name: str) -> list[int]:
+        """
+        Like the name-only text search: any query word may prefix-match a word of the name,
+        more matched words first. Falls back to a case-insensitive substring match.
+        """
+        needle = (name or "").lower()
+        hits: Counter = Counter()
+        for t in _TOKEN_RE.findall(needle):
+            hits.update(self._prefix_rows(t))
+        if hits:
+            # Row order, then (stable) more matched words first
+            order = sorted(hits)
+            order.sort(key=hits.__getitem__, reverse=True)
+            return order
+        return self._by_substring(needle)
+
+    def _prefix_rows(self, token: str) -> set[int]:
+        """Rows with a name word starting with `token` (a range of the sorted vocabulary)."""
+        rows: set[int] = set()
+        k = bisect.bisect_left(self._vocabulary, token)
+        while k < len(self._vocabulary) and self._vocabulary[k].startswith(token):
+            rows.update(self._word_rows[self._vocabulary[k]])
+            k += 1
+        return rows
+
+    def _by_substring(self, needle: str) -> list[int]:
+        if not needle:
+            return self.all()
+        if "\n" in needle:
+            return []
+        rows, start = [], 0
+        while (pos := self._names.find(needle, start)) != -1:
+            i = bisect.bisect_right(self._name_starts, pos) - 1
+            rows.append(i)
+            start = self._name_starts[i + 1] if i + 1 < self.size else len(self._names)
+        return rows
+
+    def _by_metal_ids(self, metal_ids: list[int]) -> list[int]:
+        return sorted(i for m in metal_ids for i in self._by_metal.get(m, ()))
+
+    def by_metal(self, metal: str) -> list[int]:
+        needle = (metal or "").lower()
+        return self._by_metal_ids([m for m, name, _ in self._metals if needle in name])
+
+    def by_karat(self, karat: str) -> list[int]:
+        needle = (karat or "").lower()
+        return self._by_metal_ids([m for m, _, k in self._metals if needle in k])
+
+    def by_price(
+        self,
+        min_price: float | None = None,
+        max_price: float | None = None,
+        exact_price: float | None = None,
+    ) -> list[int]:
+        """Cheapest first, like the SQL path; a binary search over the price-sorted index."""
+        if exact_price is not None:
+            min_price, max_price = exact_price - 0.01, exact_price + 0.01
+        lo = 0 if min_price is None else bisect.bisect_left(self._price_keys, min_price)
+        hi = self.size if max_price is None else bisect.bisect_right(self._price_keys, max_price)
+        return self._price_order[lo:hi]
+
+    def by_availability(self, available: bool) -> list[int]:
+        return list(self._available if available else self._unavailable)
+
+    def by_code(self, code: str) -> list[int]:
+        """Row indices of the products whose style_no or jewel_code matches, ignoring case and punctuation."""
+        return list(self._codes.get(normalize_code(code), ()))
+
+    @property
+    def code_index(self) -> CodeIndex:
+        """Typo-tolerant code lookup over this snapshot, built on first use."""
+        if self._code_index is None:
+            self._code_index = CodeIndex(self._codes)
+        return self._code_index
+
+    def index_of(self, product_id: int) -> int | None:
+        return self._positions.get(product_id)
+
+    def product(self, i: int) -> dict:
+        return {c: self.columns[c][i] for c in COLUMNS}
+
+    def page(self, indices: list[int], offset: int, limit: int, fields) -> dict:
+        """Same shape as ai._products_to_response: projected rows plus total / next_cursor."""
+        fields = [c for c in COLUMNS if c in fields]
+        window = indices[offset:offset + limit]
+        next_offset = offset + len(window)
+        return {
+            "products": [{f: self.columns[f][i] for f in fields} for i in window],
+            "total": len(indices),
+            "next_cursor": str(next_offset) if next_offset < len(indices) else None,
+        }
+
+
+class Catalog:
+    """Holds the current snapshot; reloads lazily after invalidate() or CATALOG_MAX_AGE."""
+
+    def __init__(self, max_age: float = CATALOG_MAX_AGE):
+        self.max_age = max_age
+        self.version = 0
+        self._snapshot: CatalogSnapshot | None = None
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self._product_codes: tuple[int, float, CodeIndex] | None = None
+
+    def current(self) -> CatalogSnapshot | None:
+        """The snapshot if it is up to date, else None (caller should get() it off the event loop)."""
+        snapshot = self._snapshot
+        if (
+            snapshot is None
+            or snapshot.version != self.version
+            or time.monotonic() - snapshot.loaded_at > self.max_age
+        ):
+            return None
+        return snapshot
+
+    def get(self) -> CatalogSnapshot:
+        """Return an up-to-date snapshot, loading it from the DB if needed (blocking)."""
+        snapshot = self.current()
+        if snapshot is not None:
+            return snapshot
+        with self._lock:
+            snapshot = self.current()
+            if snapshot is None:
+                snapshot = self._load()
+                self._snapshot = snapshot
+                self.reloads += 1
+        return snapshot
+
+    def _load(self) -> CatalogSnapshot:
+        version = self.version
+        db = SessionLocal()
+        try:
+            metals = db.query(Metal).all()
+            rows = db.query(
+                Product.id, Product.style_no, Product.jewel_code, Product.name, Product.gross_weight,
+                Product.image_url, Product.description, Product.metal_id, Product.availability, Product.amount,
+            ).order_by(Product.id).all()
+            return CatalogSnapshot(version, rows, metals)
+        finally:
+            db.close()
+
+    def product_code_index(self) -> CodeIndex:
+        """
+        CodeIndex whose rows are product ids, from a codes-only query: the DB path's code lookup
+        (CATALOG_SNAPSHOT=0) without loading the whole snapshot. Same staleness rules (blocking).
+        """
+        cached = self._product_codes
+        if cached is None or cached[0] != self.version or time.monotonic() - cached[1] > self.max_age:
+            version = self.version
+            db = SessionLocal()
+            try:
+                rows = db.query(Product.id, Product.style_no, Product.jewel_code).order_by(Product.id).all()
+            finally:
+                db.close()
+            codes: dict[str, list[int]] = {}
+            for r in rows:
+                add_codes(codes, r.id, r.style_no, r.jewel_code)
+            cached = self._product_codes = (version, time.monotonic(), CodeIndex(codes))
+        return cached[2]
+
+    def invalidate(self) -> None:
+        """Mark the snapshot stale; the next get() rebuilds it."""
+        self.version += 1
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "enabled": CATALOG_SNAPSHOT,
+            "version": self.version,
+            "snapshot_version": snapshot.version if snapshot else None,
+            "products": snapshot.size if snapshot else 0,
+            "age_seconds": round(time.monotonic() - snapshot.loaded_at, 1) if snapshot else None,
+            "reloads": self.reloads,
+        }
+
+
+catalog = Catalog()
+
+
+# Any committed change to products or metals (admin views, scripts) invalidates the snapshot
+@event.listens_for(Session, "before_flush")
+def _track_catalog_changes(session, flush_context, instances):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, (Product, Metal)):
+            session.info["catalog_dirty"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_catalog(session):
+    if session.info.pop("catalog_dirty", False):
+        catalog.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_catalog_changes(session):
+    session.info.pop("catalog_dirty", None)
+
+
+@event.listens_for(Session, "after_bulk_update")
+@event.listens_for(Session, "after_bulk_delete")
+def _track_bulk_changes(update_context):
+    if update_context.mapper.class_ in (Product, Metal):
+        update_context.session.info["catalog_dirty"] = True
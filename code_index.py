@@ -0,0 +1,125 @@
+"""
+Typo-tolerant lookup of product codes (style_no / jewel_code).
+
+Codes are compared in normalized form (upper case, no spaces or punctuation),
+so "rd 1001", "RD-1001" and "RD1001" are the same code. When there is no exact
+hit, a trigram index proposes candidates sharing enough trigrams with the query
+and an optimal-string-alignment edit distance (substitution, insertion, deletion,
+adjacent swap) picks the nearest codes within CODE_MAX_DISTANCE.
+`python -m benchmarks.code_lookup` measures it on a synthetic 100k catalog.
+"""
+import os
+import re
+from typing import NamedTuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CODE_MAX_DISTANCE = int(os.getenv("CODE_MAX_DISTANCE", 2))
+# Candidates (by shared trigrams) checked with the edit distance per lookup
+CODE_MAX_CANDIDATES = int(os.getenv("CODE_MAX_CANDIDATES", 200))
+
+_CODE_NOISE_RE = re.compile(r"[\s\-_/.#]+")
+
+
+def normalize_code(code: str) -> str:
+    """Canonical form of a style_no / jewel_code: upper case without spaces or punctuation."""
+    return _CODE_NOISE_RE.sub("", code or "").upper()
+
+
+def _trigrams(code: str) -> set[str]:
+    padded = f"^{code}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance, or limit + 1 as soon as it must exceed `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: list[int] | None = None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cost = 0 if ca == cb else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class CodeMatch(NamedTuple):
+    code: str
+    row: int
+    distance: int
+
+
+class CodeIndex:
+    """
+    Exact map plus trigram postings over normalized codes. Each code maps to the rows (opaque ids,
+    e.g. snapshot indices) of every product carrying it, since style numbers are not unique.
+    """
+
+    def __init__(self, codes: dict[str, list[int]], max_distance: int = CODE_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._exact = codes
+        self._codes = list(codes)
+        self._postings: dict[str, list[int]] = {}
+        for n, code in enumerate(self._codes):
+            for gram in _trigrams(code):
+                self._postings.setdefault(gram, []).append(n)
+        self._common_limit = max(5000, len(self._codes) // 20)
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def lookup(self, code: str, limit: int | None = 5) -> tuple[str, list[CodeMatch]]:
+        """
+        ("exact", a match per product with the code) | ("nearest", matches closest first) | ("none", []).
+        `limit` bounds the nearest matches (None: all within the distance); an exact hit returns
+        every product with the code. Each row appears once, under its closest code.
+        """
+        query = normalize_code(code)
+        if not query:
+            return "none", []
+        rows = self._exact.get(query)
+        if rows:
+            return "exact", [CodeMatch(query, row, 0) for row in rows]
+
+        # Short codes tolerate fewer edits, or everything would be "near"
+        max_distance = min(self.max_distance, max(1, len(query) // 4))
+        # Trigrams shared by a large part of the catalog (a common "RD" prefix) barely narrow
+        # the candidates and are the longest lists to scan, so they are left out
+        grams = _trigrams(query)
+        selective = [g for g in grams if len(self._postings.get(g, ())) <= self._common_limit] or list(grams)
+        shared: dict[int, int] = {}
+        for gram in selective:
+            for n in self._postings.get(gram, ()):
+                shared[n] = shared.get(n, 0) + 1
+        # Each edit breaks at most four trigrams (an adjacent swap; other edits three)
+        required = max(1, len(selective) - 4 * max_distance)
+        candidates = sorted(
+            (n for n, count in shared.items() if count >= required),
+            key=lambda n: -shared[n],
+        )[:CODE_MAX_CANDIDATES]
+
+        matches = []
+        for n in candidates:
+            candidate = self._codes[n]
+            distance = edit_distance(query, candidate, max_distance)
+            if distance <= max_distance:
+                # Ties: same length first (a mistyped character beats a dropped one), then more shared trigrams
+                matches.append((distance, abs(len(candidate) - len(query)), -shared[n], candidate))
+        matches.sort()
+        nearest, seen = [], set()
+        for d, _, _, c in matches:
+            for row in self._exact[c]:
+                # A product whose style_no and jewel_code are both near is listed once
+                if row not in seen:
+                    seen.add(row)
+                    nearest.append(CodeMatch(c, row, d))
+        return ("nearest", nearest[:limit]) if nearest else ("none", [])
@@ -0,0 +1,109 @@
+"""
+Pre-warmed pool of OpenAI conversation ids.
+
+Every lead gets its own Responses API conversation (stored in Lead.thread_id).
+Creating one is a network round trip, so a background task keeps a few empty
+conversations ready: a first-time sender takes one from the pool instead of
+waiting on conversations.create() before the assistant can even start.
+Pooled ids live only in this process's memory: each restart (and each extra
+worker process) abandons up to CONVERSATION_POOL_SIZE unused conversations,
+so the pool is kept small.
+"""
+import asyncio
+import os
+from collections import deque
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CONVERSATION_POOL_SIZE = int(os.getenv("CONVERSATION_POOL_SIZE", 2))
+# Back-off between refill attempts after an API error
+CONVERSATION_POOL_RETRY = float(os.getenv("CONVERSATION_POOL_RETRY", 30))
+
+
+class ConversationPool:
+    """Keeps up to `size` unused conversation ids, refilled in the background."""
+
+    def __init__(self, client, size: int = CONVERSATION_POOL_SIZE):
+        self.client = client
+        self.size = size
+        self._ids: deque[str] = deque()
+        self._refill_task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._started = False
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+
+    def start(self) -> None:
+        """Begin filling the pool (call from the running event loop)."""
+        self._loop = asyncio.get_running_loop()
+        self._started = True
+        self._schedule_refill()
+
+    async def stop(self) -> None:
+        self._started = False
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+            await asyncio.gather(self._refill_task, return_exceptions=True)
+            self._refill_task = None
+
+    def take(self) -> str | None:
+        """
+        Return a ready conversation id without waiting, or None if the pool is empty.
+        Safe to call from worker threads (the webhook's lead upsert runs in one).
+        """
+        try:
+            conversation_id = self._ids.popleft()
+        except IndexError:
+            # Empty means a refill is already under way (or the pool is off)
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._schedule_refill()
+        return conversation_id
+
+    async def acquire(self) -> str:
+        """Return a pooled conversation id, creating one on the spot only if the pool is empty."""
+        conversation_id = self.take()
+        if conversation_id is None:
+            conversation_id = (await self.client.conversations.create()).id
+            self.created += 1
+        return conversation_id
+
+    def _schedule_refill(self) -> None:
+        if not self._started or self.size <= 0:
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._start_refill()
+        else:
+            self._loop.call_soon_threadsafe(self._start_refill)
+
+    def _start_refill(self) -> None:
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill(), name="conversation-pool-refill")
+
+    async def _refill(self) -> None:
+        while len(self._ids) < self.size:
+            try:
+                conv = await self.client.conversations.create()
+            except Exception as e:
+                print(f"Conversation pool refill failed: {e!r}")
+                await asyncio.sleep(CONVERSATION_POOL_RETRY)
+                continue
+            self._ids.append(conv.id)
+            self.created += 1
+
+    def stats(self) -> dict:
+        return {
+            "ready": len(self._ids),
+            "target_size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "created": self.created,
+        }
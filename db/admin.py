@@ -4,7 +4,8 @@ from starlette.requests import Request
 from starlette.responses import RedirectResponse
 from wtforms import Form, TextAreaField, validators
 import os
-import requests
+from whatsapp_client import send_message
+from lead_cache import lead_cache
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -91,6 +92,13 @@ class LeadAdmin(ModelView, model=Lead):
         "created_at": lambda m, a: m.created_at.strftime("%Y-%m-%d %H:%M:%S") if m.created_at else ""
     }
 
+    async def after_model_change(self, data, model, is_created, request):
+        # Phone edits change the cache key; drop whatever the webhook cached for this lead
+        lead_cache.invalidate_lead(model.id)
+
+    async def after_model_delete(self, model, request):
+        lead_cache.invalidate_lead(model.id)
+
 
 class GroupAdmin(ModelView, model=Group):
     name = "Group"
@@ -160,12 +168,6 @@ class GroupAdmin(ModelView, model=Group):
                     if not group or not group.leads:
                         continue
                     
-                    url = f"https://graph.facebook.com/{version}/{number_id}/messages"
-                    headers = {
-                        "Authorization": f"Bearer {token}",
-                        "Content-type": "application/json"
-                    }
-                    
                     # Send to each lead in the group
                     for lead in group.leads:
                         data = {
@@ -179,7 +181,7 @@ class GroupAdmin(ModelView, model=Group):
                         }
                         
                         try:
-                            response = requests.post(url=url, headers=headers, json=data)
+                            response = await send_message(data)
                             if response.status_code == 200:
                                 total_sent += 1
                             else:
@@ -298,12 +300,6 @@ class GroupAdmin(ModelView, model=Group):
                     if not group or not group.leads:
                         continue
                     
-                    url = f"https://graph.facebook.com/{version}/{number_id}/messages"
-                    headers = {
-                        "Authorization": f"Bearer {token}",
-                        "Content-type": "application/json"
-                    }
-                    
                     # Send to each lead in the group
                     for lead in group.leads:
                         data = {
@@ -319,7 +315,7 @@ class GroupAdmin(ModelView, model=Group):
                         }
                         
                         try:
-                            response = requests.post(url=url, headers=headers, json=data)
+                            response = await send_message(data)
                             if response.status_code == 200:
                                 total_sent += 1
                             else:
@@ -0,0 +1,127 @@
+"""
+Full-text product search over name, description, style_no and jewel_code.
+
+SQLite: an external-content FTS5 table (products_fts) kept in sync by triggers
+and ranked with bm25(). Postgres: a GIN tsvector expression index plus a
+trigram index on name, ranked with ts_rank / similarity(). Other backends fall
+back to ILIKE on the name.
+"""
+import re
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# bm25 column weights: name, description, style_no, jewel_code
+_FTS_WEIGHTS = "10.0, 1.0, 5.0, 5.0"
+
+SQLITE_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, description, style_no, jewel_code,
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, description, style_no, jewel_code)
+        VALUES (new.id, new.name, new.description, new.style_no, new.jewel_code);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description, style_no, jewel_code)
+        VALUES ('delete', old.id, old.name, old.description, old.style_no, old.jewel_code);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description, style_no, jewel_code ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description, style_no, jewel_code)
+        VALUES ('delete', old.id, old.name, old.description, old.style_no, old.jewel_code);
+        INSERT INTO products_fts(rowid, name, description, style_no, jewel_code)
+        VALUES (new.id, new.name, new.description, new.style_no, new.jewel_code);
+    END
+    """,
+]
+
+# Must match the indexed expression exactly for Postgres to use ix_products_search_tsv
+PG_TSVECTOR = (
+    "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(description, '') || ' ' || "
+    "coalesce(style_no, '') || ' ' || coalesce(jewel_code, ''))"
+)
+
+POSTGRES_FTS_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_products_search_tsv ON products USING GIN ({PG_TSVECTOR})",
+    "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING GIN (name gin_trgm_ops)",
+]
+
+
+def ensure_search_index(engine: Engine) -> None:
+    """Create the search index if missing (fresh databases made by create_all); migration 008 does the same."""
+    with engine.begin() as conn:
+        dialect = conn.dialect.name
+        if dialect == "sqlite":
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+            ).first()
+            for ddl in SQLITE_FTS_DDL:
+                conn.execute(text(ddl))
+            if not exists:
+                conn.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+        elif dialect == "postgresql":
+            for ddl in POSTGRES_FTS_DDL:
+                conn.execute(text(ddl))
+
+
+def _tokens(query: str) -> list[str]:
+    return _TOKEN_RE.findall((query or "").lower())
+
+
+def search_product_ids(conn: Connection, query: str, limit: int | None = 10, name_only: bool = False) -> list[int]:
+    """
+    Ids of the best `limit` products (all matches if None) for `query`, best first. Any
+    token may match (prefix match); ranking favours products matching more / rarer tokens,
+    especially in the name. Returns [] on backends without a text index.
+    """
+    tokens = _tokens(query)
+    if not tokens:
+        return []
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        limit = -1 if limit is None else limit
+        terms = " OR ".join(f'"{t}"*' for t in tokens)
+        match = f"name : ({terms})" if name_only else terms
+        rows = conn.execute(
+            text(
+                f"SELECT rowid FROM products_fts WHERE products_fts MATCH :match "
+                f"ORDER BY bm25(products_fts, {_FTS_WEIGHTS}) LIMIT :limit"
+            ),
+            {"match": match, "limit": limit},
+        )
+        return [row[0] for row in rows]
+    if dialect == "postgresql":
+        params = {"raw": " ".join(tokens), "limit": limit}
+        if name_only:
+            # ILIKE '%token%' is served by the trigram index on name
+            params["patterns"] = [f"%{t}%" for t in tokens]
+            sql = (
+                "SELECT id FROM products WHERE name ILIKE ANY (:patterns) "
+                "ORDER BY similarity(name, :raw) DESC LIMIT :limit"
+            )
+        else:
+            params["q"] = " | ".join(f"{t}:*" for t in tokens)
+            sql = (
+                f"SELECT id FROM products WHERE {PG_TSVECTOR} @@ to_tsquery('simple', :q) OR name % :raw "
+                f"ORDER BY ts_rank({PG_TSVECTOR}, to_tsquery('simple', :q)) DESC, "
+                f"similarity(name, :raw) DESC LIMIT :limit"
+            )
+        return [row[0] for row in conn.execute(text(sql), params)]
+    return []
+
+
+def has_search_index(conn: Connection) -> bool:
+    return conn.dialect.name in ("sqlite", "postgresql")
+
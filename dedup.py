@@ -0,0 +1,162 @@
+"""
+Deduplication of inbound WhatsApp messages by message id.
+
+Meta redelivers webhooks it thinks we missed. A bounded in-memory LRU answers
+the common "just saw it" case without touching the DB; the processed_messages
+table (unique on message_id) catches retries after a restart or on another
+worker process.
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from db.models import ProcessedMessage
+
+load_dotenv()
+
+DEDUP_LRU_SIZE = int(os.getenv("DEDUP_LRU_SIZE", 10000))
+DEDUP_RETENTION_HOURS = int(os.getenv("DEDUP_RETENTION_HOURS", 72))
+# Prune expired rows once every N newly claimed ids to keep the table small
+DEDUP_PRUNE_EVERY = int(os.getenv("DEDUP_PRUNE_EVERY", 1000))
+
+
+class MessageDeduplicator:
+    """LRU of recently seen message ids in front of the processed_messages table."""
+
+    def __init__(self, maxsize: int = DEDUP_LRU_SIZE):
+        self.maxsize = maxsize
+        self._seen: OrderedDict[str, None] = OrderedDict()
+        # Claims run in worker threads; the DB unique constraint settles races, this guards the LRU
+        self._lock = threading.Lock()
+        self.lru_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.released = 0
+
+    def _remember(self, message_id: str) -> None:
+        with self._lock:
+            self._seen[message_id] = None
+            self._seen.move_to_end(message_id)
+            while len(self._seen) > self.maxsize:
+                self._seen.popitem(last=False)
+
+    def _seen_before(self, message_id: str) -> bool:
+        with self._lock:
+            if message_id not in self._seen:
+                return False
+            self._seen.move_to_end(message_id)
+            return True
+
+    def claim(self, db: Session, message_id: str | None) -> bool:
+        """
+        Mark `message_id` as processed. Returns True if this is the first time we see it
+        (caller should process it), False if it is a redelivery (caller should skip it).
+        """
+        if not message_id:
+            return True
+        if self._seen_before(message_id):
+            self.lru_hits += 1
+            return False
+        try:
+            db.add(ProcessedMessage(message_id=message_id))
+            db.commit()
+        except IntegrityError:
+            # Unique constraint: already claimed before a restart or by another worker
+            db.rollback()
+            self._remember(message_id)
+            self.db_hits += 1
+            return False
+        self._remember(message_id)
+        self.misses += 1
+        if DEDUP_PRUNE_EVERY and self.misses % DEDUP_PRUNE_EVERY == 0:
+            self.prune(db)
+        return True
+
+    def claim_many(self, db: Session, message_ids: list[str | None]) -> set[str | None]:
+        """
+        Batch version of claim() for a whole webhook payload: one SELECT and one INSERT
+        for all ids not already in the LRU. Returns the ids that should be processed
+        (None is always included so messages without an id are never dropped).
+        """
+        fresh: set[str | None] = {None}
+        candidates = []
+        for message_id in dict.fromkeys(message_ids):
+            if not message_id:
+                continue
+            if self._seen_before(message_id):
+                self.lru_hits += 1
+            else:
+                candidates.append(message_id)
+        if not candidates:
+            return fresh
+
+        existing = {
+            row.message_id
+            for row in db.query(ProcessedMessage.message_id)
+            .filter(ProcessedMessage.message_id.in_(candidates))
+            .all()
+        }
+        for message_id in existing:
+            self._remember(message_id)
+        self.db_hits += len(existing)
+        new_ids = [m for m in candidates if m not in existing]
+        if not new_ids:
+            return fresh
+        try:
+            db.add_all([ProcessedMessage(message_id=m) for m in new_ids])
+            db.commit()
+        except IntegrityError:
+            # Another worker claimed one of them in between; settle each id individually
+            db.rollback()
+            return fresh | {m for m in new_ids if self.claim(db, m)}
+        for message_id in new_ids:
+            self._remember(message_id)
+        self.misses += len(new_ids)
+        if DEDUP_PRUNE_EVERY and self.misses % DEDUP_PRUNE_EVERY < len(new_ids):
+            self.prune(db)
+        return fresh | set(new_ids)
+
+    def release(self, db: Session, message_ids: list[str | None]) -> None:
+        """Forget claimed ids whose reply failed or was dropped, so Meta's redelivery is processed again."""
+        ids = [m for m in message_ids if m]
+        if not ids:
+            return
+        with self._lock:
+            for message_id in ids:
+                self._seen.pop(message_id, None)
+        db.query(ProcessedMessage).filter(ProcessedMessage.message_id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        self.released += len(ids)
+
+    def prune(self, db: Session) -> int:
+        """Delete persisted ids older than the retention window (Meta stops retrying long before)."""
+        cutoff = datetime.utcnow() - timedelta(hours=DEDUP_RETENTION_HOURS)
+        deleted = (
+            db.query(ProcessedMessage)
+            .filter(ProcessedMessage.created_at < cutoff)
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        return deleted
+
+    def stats(self) -> dict:
+        """Hit/miss counters: every hit is an assistant call + reply we did not repeat."""
+        hits = self.lru_hits + self.db_hits
+        total = hits + self.misses
+        return {
+            "lru_size": len(self._seen),
+            "lru_maxsize": self.maxsize,
+            "lru_hits": self.lru_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "released": self.released,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+        }
+
+
+deduplicator = MessageDeduplicator()
@@ -0,0 +1,306 @@
+"""
+Background ingest queue for the WhatsApp webhook.
+
+In "queue" mode the POST /webhook handler only parses the payload, enqueues it
+and acks Meta straight away. A pool of async workers drains the queue and runs
+the lead / assistant / reply pipeline, so slow model rounds never hold up the
+HTTP response (and never trigger Meta's timeout + redelivery).
+
+SenderScheduler then fans the individual messages out by sender: one lead's
+messages run strictly in order (the Responses API rejects or interleaves
+concurrent turns on one conversation) while different leads run in parallel.
+Its backlog is bounded: once SENDER_MAX_PENDING messages are queued or running,
+workers wait for room and the webhook answers 503 so Meta redelivers later.
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "inline" keeps the old behaviour (process before returning 200), "queue" acks first.
+INGEST_MODE = os.getenv("INGEST_MODE", "inline").lower()
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 4))
+INGEST_QUEUE_MAXSIZE = int(os.getenv("INGEST_QUEUE_MAXSIZE", 1000))
+INGEST_SHUTDOWN_TIMEOUT = float(os.getenv("INGEST_SHUTDOWN_TIMEOUT", 10))
+# Pending messages allowed per sender, and senders processed at the same time
+SENDER_QUEUE_MAXSIZE = int(os.getenv("SENDER_QUEUE_MAXSIZE", 50))
+SENDER_MAX_CONCURRENCY = int(os.getenv("SENDER_MAX_CONCURRENCY", 64))
+# Messages queued or running across all senders; beyond it the webhook answers 503
+SENDER_MAX_PENDING = int(os.getenv("SENDER_MAX_PENDING", 1000))
+# Burst coalescing: messages from one sender arriving within the window become one job (0 = off)
+COALESCE_WINDOW_MS = int(os.getenv("COALESCE_WINDOW_MS", 0))
+COALESCE_MAX_WAIT_MS = int(os.getenv("COALESCE_MAX_WAIT_MS", 5000))
+COALESCE_MAX_MESSAGES = int(os.getenv("COALESCE_MAX_MESSAGES", 10))
+
+
+class IngestQueue:
+    """Bounded asyncio queue of webhook payloads drained by a pool of worker tasks."""
+
+    def __init__(
+        self,
+        handler: Callable[[dict], Awaitable[None]],
+        workers: int = INGEST_WORKERS,
+        maxsize: int = INGEST_QUEUE_MAXSIZE,
+    ):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.maxsize = maxsize
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.busy = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        """Create the queue and spawn the worker tasks (call from the running event loop)."""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"ingest-worker-{i}")
+            for i in range(self.workers)
+        ]
+        print(f"Ingest queue started with {self.workers} worker(s), maxsize={self.maxsize}")
+
+    async def stop(self, timeout: float = INGEST_SHUTDOWN_TIMEOUT) -> None:
+        """Give in-flight payloads `timeout` seconds to finish, then cancel the workers."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"Ingest queue shutdown: {self._queue.qsize()} payload(s) left unprocessed")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def put(self, payload: dict) -> bool:
+        """Enqueue a payload without waiting. Returns False when the queue is full."""
+        if self._queue is None:
+            raise RuntimeError("IngestQueue.put() called before start()")
+        try:
+            self._queue.put_nowait((time.monotonic(), payload))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            enqueued_at, payload = await self._queue.get()
+            wait = time.monotonic() - enqueued_at
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self.busy += 1
+            try:
+                await self.handler(payload)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Ingest worker {index} failed to process payload: {e!r}")
+            finally:
+                self.busy -= 1
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        """Queue depth, throughput counters and queue wait times (seconds) for sizing the pool."""
+        dequeued = self.processed + self.failed + self.busy
+        return {
+            "mode": INGEST_MODE,
+            "running": self.running,
+            "workers": self.workers,
+            "busy_workers": self.busy,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_maxsize": self.maxsize,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_seconds": round(self._wait_total / dequeued, 4) if dequeued else 0.0,
+            "max_wait_seconds": round(self._wait_max, 4),
+        }
+
+
+class SenderScheduler:
+    """
+    Keyed executor: jobs with the same key (wa_id) run one at a time in submission
+    order, jobs with different keys run concurrently up to `max_concurrency`.
+    Each active key gets a bounded queue and a drain task that exits once the
+    queue is empty, so idle senders cost nothing; `max_pending` bounds the jobs
+    queued or running over all keys. With `merge` and a coalesce window set, a
+    burst of jobs for one key is folded into a single job.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[object], Awaitable[None]],
+        queue_maxsize: int = SENDER_QUEUE_MAXSIZE,
+        max_concurrency: int = SENDER_MAX_CONCURRENCY,
+        max_pending: int = SENDER_MAX_PENDING,
+        merge: Callable[[list], object] | None = None,
+        coalesce_window: float = COALESCE_WINDOW_MS / 1000,
+        coalesce_max_wait: float = COALESCE_MAX_WAIT_MS / 1000,
+        coalesce_max_jobs: int = COALESCE_MAX_MESSAGES,
+    ):
+        self.handler = handler
+        self.queue_maxsize = queue_maxsize
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_pending = max(1, max_pending)
+        self.merge = merge
+        self.coalesce_window = coalesce_window
+        self.coalesce_max_wait = coalesce_max_wait
+        self.coalesce_max_jobs = max(1, coalesce_max_jobs)
+        self._queues: dict[str, asyncio.Queue] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._slots: asyncio.Semaphore | None = None
+        self._capacity = asyncio.Event()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.running_senders = 0
+        self.peak_active_senders = 0
+
+    @property
+    def pending(self) -> int:
+        """Jobs submitted and not finished yet (queued or running)."""
+        return self.submitted - self.completed - self.failed
+
+    @property
+    def full(self) -> bool:
+        return self.pending >= self.max_pending
+
+    async def wait_for_capacity(self) -> None:
+        """Block until fewer than `max_pending` jobs are queued or running."""
+        while self.full:
+            self._capacity.clear()
+            await self._capacity.wait()
+
+    def submit(self, key: str, job) -> asyncio.Future | None:
+        """
+        Queue `job` behind any pending jobs for `key`. Returns a future resolved when the
+        job has run (True, or False if the handler raised), or None if that sender's queue
+        or the scheduler as a whole is full.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        if self.full:
+            self.rejected += 1
+            return None
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = asyncio.Queue(maxsize=self.queue_maxsize)
+        done = asyncio.get_running_loop().create_future()
+        try:
+            queue.put_nowait((job, done))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return None
+        self.submitted += 1
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._drain(key, queue), name=f"sender-{key}")
+            self.peak_active_senders = max(self.peak_active_senders, len(self._tasks))
+        return done
+
+    async def _collect_burst(self, queue: asyncio.Queue, first) -> list:
+        """
+        Debounce: keep taking jobs that arrive within `coalesce_window` of the previous one,
+        bounded by `coalesce_max_wait` overall and `coalesce_max_jobs` per batch.
+        """
+        batch = [first]
+        deadline = time.monotonic() + self.coalesce_max_wait
+        while len(batch) < self.coalesce_max_jobs:
+            timeout = min(self.coalesce_window, deadline - time.monotonic())
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _drain(self, key: str, queue: asyncio.Queue) -> None:
+        while True:
+            try:
+                first = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                # No await between the empty check and the cleanup, so submit() cannot slip in
+                del self._queues[key]
+                del self._tasks[key]
+                return
+            if self.merge is not None and self.coalesce_window > 0:
+                batch = await self._collect_burst(queue, first)
+            else:
+                batch = [first]
+            jobs = [job for job, _ in batch]
+            if len(jobs) > 1:
+                self.coalesced += len(jobs) - 1
+                job = self.merge(jobs)
+            else:
+                job = jobs[0]
+            async with self._slots:
+                self.running_senders += 1
+                ok = False
+                try:
+                    await self.handler(job)
+                    self.completed += len(jobs)
+                    ok = True
+                except Exception as e:
+                    self.failed += len(jobs)
+                    print(f"Sender {key} job failed: {e!r}")
+                finally:
+                    self.running_senders -= 1
+                    if not self.full:
+                        self._capacity.set()
+                    for _, done in batch:
+                        if not done.done():
+                            done.set_result(ok)
+
+    async def join(self, timeout: float = INGEST_SHUTDOWN_TIMEOUT) -> None:
+        """Wait for all pending per-sender work (used on shutdown)."""
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            print(f"Sender scheduler shutdown: {len(pending)} sender(s) still busy, cancelled")
+
+    def stats(self) -> dict:
+        """Active-sender and per-sender backlog metrics."""
+        depths = [q.qsize() for q in self._queues.values()]
+        return {
+            "active_senders": len(self._tasks),
+            "running_senders": self.running_senders,
+            "peak_active_senders": self.peak_active_senders,
+            "max_concurrency": self.max_concurrency,
+            "pending_jobs": self.pending,
+            "max_pending": self.max_pending,
+            "queued_jobs": sum(depths),
+            "max_sender_queue_depth": max(depths, default=0),
+            "sender_queue_maxsize": self.queue_maxsize,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "coalesce_window_ms": int(self.coalesce_window * 1000),
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,228 @@
+"""
+Rule-based fast path for formulaic catalog questions.
+
+"price of RD1001", "photo of JC-12345", "gold rate today" and "22K items" are
+answered straight from the catalog snapshot with a templated reply (and
+send_img for photos), skipping the model's tool-picking and phrasing rounds.
+A message is only routed when a keyword matches, the entity (code, metal,
+karat) resolves in the catalog and the message is short enough to be just
+that question; anything else goes to the assistant as before. The assistant
+appends routed exchanges to the lead's OpenAI conversation, so follow-ups ("send
+me its photo") still resolve.
+"""
+import asyncio
+import os
+import re
+import time
+from typing import Awaitable, Callable, NamedTuple
+
+from dotenv import load_dotenv
+
+from catalog import CatalogSnapshot, catalog
+from send_msg import send_img_async
+
+load_dotenv()
+
+INTENT_ROUTER = os.getenv("INTENT_ROUTER", "1") == "1"
+INTENT_MIN_CONFIDENCE = float(os.getenv("INTENT_MIN_CONFIDENCE", 0.8))
+# Longer messages usually carry more than the one question; confidence drops past this
+INTENT_MAX_WORDS = int(os.getenv("INTENT_MAX_WORDS", 12))
+INTENT_LIST_SIZE = int(os.getenv("INTENT_LIST_SIZE", 5))
+
+_PRICE_RE = re.compile(r"\b(price|prices|cost|rate|how much|mrp|amount)\b", re.IGNORECASE)
+_PHOTO_RE = re.compile(r"\b(photo|photos|pic|pics|picture|pictures|image|images|img)\b", re.IGNORECASE)
+_RATE_RE = re.compile(r"\b(rate|rates|price|prices)\b", re.IGNORECASE)
+_KARAT_RE = re.compile(r"\b(\d{2})\s?(?:k|kt|karat|carat|ct)\b", re.IGNORECASE)
+_WORD_RE = re.compile(r"\w+")
+_CODE_TOKEN_RE = re.compile(r"[\w\-/.#]+")
+
+# Metal-rate and karat-listing questions are only routed when every word is one of these
+# (plus metal names and the karat); "22k rings under 50000" needs the assistant.
+_FILLER_WORDS = {
+    "what", "whats", "is", "are", "the", "of", "for", "in", "me", "you", "do", "any", "all",
+    "please", "pls", "tell", "show", "list", "now", "today", "todays", "current", "live", "s",
+    "k", "kt", "karat", "carat", "ct",
+}
+_RATE_WORDS = _FILLER_WORDS | {"rate", "rates", "price", "prices", "per", "gram", "gm", "g"}
+_LIST_WORDS = _FILLER_WORDS | {
+    "item", "items", "product", "products", "jewellery", "jewelry", "design", "designs",
+    "collection", "pieces", "have", "available", "ornaments",
+}
+
+
+class IntentMatch(NamedTuple):
+    intent: str
+    confidence: float
+    respond: Callable[[], Awaitable[str]]
+
+
+def _money(amount: float | None) -> str:
+    return f"₹{amount or 0:,.2f}"
+
+
+def _confidence(text: str) -> float:
+    return 1.0 if len(_WORD_RE.findall(text)) <= INTENT_MAX_WORDS else 0.6
+
+
+def _find_product(snapshot: CatalogSnapshot, text: str) -> int | None:
+    """
+    The one product the codes in the text name, also trying a token joined with the previous
+    one ("RD 1001"). Several products (two codes, or a code they share) are left to the assistant.
+    """
+    tokens = _CODE_TOKEN_RE.findall(text)
+    found: set[int] = set()
+    for n, token in enumerate(tokens):
+        if not any(ch.isdigit() for ch in token):
+            continue
+        for candidate in (token, tokens[n - 1] + token if n else None):
+            rows = snapshot.by_code(candidate) if candidate else []
+            if rows:
+                found.update(rows)
+                break
+    return next(iter(found)) if len(found) == 1 else None
+
+
+def _only_words(text: str, allowed: set[str], snapshot: CatalogSnapshot) -> bool:
+    metals = {(metal or "").lower() for metal, _, _ in snapshot.metal_rates}
+    return all(
+        w in allowed or w in metals or _KARAT_RE.fullmatch(w) or (w.isdigit() and len(w) == 2)
+        for w in _WORD_RE.findall(text.lower())
+    )
+
+
+def _describe(product: dict, available: bool) -> str:
+    reply = f"{product['name']} ({product['style_no']}), {product['metal_info']}, {product['gross_weight']} g: {_money(product['calculated_amount'])}"
+    return reply if available else f"{reply} (currently not available)"
+
+
+class IntentRouter:
+    """Matches a message against the intents in priority order; keeps per-intent hit and latency stats."""
+
+    def __init__(self, min_confidence: float = INTENT_MIN_CONFIDENCE):
+        self.min_confidence = min_confidence
+        self.matchers = [self._photo_of_code, self._price_of_code, self._metal_rate, self._karat_items]
+        self.passed = 0
+        self._stats: dict[str, dict] = {}
+
+    def match(self, snapshot: CatalogSnapshot, text: str, user_phone: str | None) -> IntentMatch | None:
+        for matcher in self.matchers:
+            found = matcher(snapshot, text, user_phone)
+            if found is not None:
+                return found
+        return None
+
+    async def route(self, text: str, user_phone: str | None) -> str | None:
+        """Templated reply for a confidently recognised intent, or None to fall back to the assistant."""
+        start = time.perf_counter()
+        snapshot = catalog.current() or await asyncio.to_thread(catalog.get)
+        found = self.match(snapshot, text or "", user_phone)
+        if found is None:
+            self.passed += 1
+            return None
+        stats = self._stats.setdefault(found.intent, {"hits": 0, "fallbacks": 0, "total_ms": 0.0, "max_ms": 0.0})
+        if found.confidence < self.min_confidence:
+            stats["fallbacks"] += 1
+            return None
+        try:
+            reply = await found.respond()
+        except Exception as e:
+            # E.g. the photo send failed: the assistant can still answer
+            print(f"Intent {found.intent} failed, falling back to the assistant: {e!r}")
+            stats["fallbacks"] += 1
+            return None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        stats["hits"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        return reply
+
+    # --- intents: return a match only when the entity resolves in the catalog ---
+
+    def _photo_of_code(self, snapshot, text, user_phone):
+        if not user_phone or not _PHOTO_RE.search(text):
+            return None
+        i = _find_product(snapshot, text)
+        if i is None or not snapshot.columns["image_url"][i]:
+            return None
+        product = snapshot.product(i)
+
+        async def respond() -> str:
+            caption = _describe(product, snapshot.available[i])
+            response = await send_img_async(user_contact_number=user_phone, link=product["image_url"], caption=caption)
+            if response.status_code != 200:
+                return f"Sorry, I couldn't send the photo right now. {caption}"
+            return f"Here is the photo of {product['name']} ({product['style_no']})."
+
+        return IntentMatch("photo_of_code", _confidence(text), respond)
+
+    def _price_of_code(self, snapshot, text, user_phone):
+        if not _PRICE_RE.search(text):
+            return None
+        i = _find_product(snapshot, text)
+        if i is None:
+            return None
+        reply = _describe(snapshot.product(i), snapshot.available[i])
+
+        async def respond() -> str:
+            return reply
+
+        return IntentMatch("price_of_code", _confidence(text), respond)
+
+    def _metal_rate(self, snapshot, text, user_phone):
+        if not _RATE_RE.search(text) or not _only_words(text, _RATE_WORDS, snapshot):
+            return None
+        lowered = text.lower()
+        karat = _KARAT_RE.search(text)
+        rates = [
+            (metal, k, rate) for metal, k, rate in snapshot.metal_rates
+            if metal and metal.lower() in lowered and (karat is None or karat.group(1) in (k or ""))
+        ]
+        if not rates:
+            return None
+        lines = [f"{metal} {k}: {_money(rate)} per gram" for metal, k, rate in rates]
+
+        async def respond() -> str:
+            return "Today's rates:\n" + "\n".join(lines)
+
+        return IntentMatch("metal_rate", 1.0, respond)
+
+    def _karat_items(self, snapshot, text, user_phone):
+        karat = _KARAT_RE.search(text)
+        if karat is None or not _only_words(text, _LIST_WORDS, snapshot):
+            return None
+        label = f"{karat.group(1)}K"
+        indices = [i for i in snapshot.by_karat(karat.group(1)) if snapshot.available[i]]
+        if not indices:
+            return None
+        lines = [f"- {_describe(snapshot.product(i), True)}" for i in indices[:INTENT_LIST_SIZE]]
+        more = len(indices) - len(lines)
+
+        async def respond() -> str:
+            reply = f"We have {len(indices)} {label} pieces available. Some of them:\n" + "\n".join(lines)
+            if more > 0:
+                reply += f"\n…and {more} more. Tell me what you're looking for (type, budget) and I'll narrow it down."
+            return reply
+
+        return IntentMatch("karat_items", 1.0, respond)
+
+    def stats(self) -> dict:
+        intents = {
+            name: {
+                "hits": s["hits"],
+                "fallbacks": s["fallbacks"],
+                "avg_ms": round(s["total_ms"] / s["hits"], 2) if s["hits"] else 0.0,
+                "max_ms": round(s["max_ms"], 2),
+            }
+            for name, s in self._stats.items()
+        }
+        routed = sum(s["hits"] for s in self._stats.values())
+        total = routed + self.passed + sum(s["fallbacks"] for s in self._stats.values())
+        return {
+            "enabled": INTENT_ROUTER,
+            "routed": routed,
+            "hit_rate": round(routed / total, 4) if total else 0.0,
+            "intents": intents,
+        }
+
+
+intent_router = IntentRouter()
@@ -0,0 +1,92 @@
+"""
+In-process cache of wa_id -> (lead id, phone, conversation id).
+
+The webhook and the assistant both need the sender's lead on every message;
+a returning customer is served from here without touching the leads table.
+Entries expire after LEAD_CACHE_TTL seconds and are invalidated when LeadAdmin
+edits or deletes a lead, or when a new conversation id is stored.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LEAD_CACHE_SIZE = int(os.getenv("LEAD_CACHE_SIZE", 10000))
+LEAD_CACHE_TTL = float(os.getenv("LEAD_CACHE_TTL", 3600))
+
+
+class CachedLead(NamedTuple):
+    lead_id: int
+    phone: str
+    thread_id: str | None
+
+
+class LeadCache:
+    """Bounded TTL + LRU map keyed by wa_id (the lead's phone)."""
+
+    def __init__(self, maxsize: int = LEAD_CACHE_SIZE, ttl: float = LEAD_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, CachedLead]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, wa_id: str) -> CachedLead | None:
+        with self._lock:
+            entry = self._entries.get(wa_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[wa_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(wa_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, lead: CachedLead) -> None:
+        with self._lock:
+            self._entries[lead.phone] = (time.monotonic() + self.ttl, lead)
+            self._entries.move_to_end(lead.phone)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def set_thread_id(self, lead: CachedLead, thread_id: str) -> CachedLead:
+        """Record a newly created conversation id and return the updated entry."""
+        updated = lead._replace(thread_id=thread_id)
+        self.put(updated)
+        return updated
+
+    def invalidate(self, wa_id: str) -> None:
+        with self._lock:
+            self._entries.pop(wa_id, None)
+
+    def invalidate_lead(self, lead_id: int) -> None:
+        """Drop the entry for a lead id (its phone may have just changed)."""
+        with self._lock:
+            for wa_id, (_, lead) in list(self._entries.items()):
+                if lead.lead_id == lead_id:
+                    del self._entries[wa_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+lead_cache = LeadCache()
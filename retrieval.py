@@ -0,0 +1,248 @@
+"""
+In-process BM25 index over product name, description, metal and karat.
+
+Customers describe pieces loosely ("thin chain for daily wear", "bridal necklace
+heavy"); substring and prefix matching on the name miss most of that. The index is
+built once at startup and then kept current incrementally: committed inserts,
+updates and deletes of products re-index just those rows on the next search, and a
+metal edit (its name or karat is indexed text) rebuilds the whole index.
+"""
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from dotenv import load_dotenv
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, joinedload, object_session
+
+from db.models import Metal, Product, SessionLocal
+
+load_dotenv()
+
+# Full rebuild interval, for edits made by other processes
+RETRIEVAL_MAX_AGE = float(os.getenv("RETRIEVAL_MAX_AGE", os.getenv("CATALOG_MAX_AGE", 300)))
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_STOP_WORDS = {
+    "a", "an", "and", "the", "for", "with", "of", "in", "on", "to", "is", "are", "or", "any",
+    "do", "you", "have", "i", "want", "need", "show", "me", "some", "something", "looking",
+}
+# Occurrences in the name count more than in the description
+_FIELD_WEIGHTS = {"name": 3, "metal": 2, "karat": 2, "description": 1}
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for t in _WORD_RE.findall((text or "").lower()):
+        if t in _STOP_WORDS:
+            continue
+        if len(t) > 3 and t.endswith("s") and not t.endswith("ss"):
+            t = t[:-1]
+        tokens.append(t)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over weighted product fields, with add / remove of single documents."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, dict[int, float]] = {}
+        self._lengths: dict[int, float] = {}
+        self._doc_terms: dict[int, tuple[str, ...]] = {}
+        self._total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    @property
+    def term_count(self) -> int:
+        return len(self._postings)
+
+    def add(self, doc_id: int, fields: dict[str, str]) -> None:
+        self.remove(doc_id)
+        tf: Counter = Counter()
+        for field, text in fields.items():
+            weight = _FIELD_WEIGHTS.get(field, 1)
+            for t in tokenize(text):
+                tf[t] += weight
+        length = sum(tf.values())
+        for t, freq in tf.items():
+            self._postings.setdefault(t, {})[doc_id] = freq
+        self._lengths[doc_id] = length
+        self._doc_terms[doc_id] = tuple(tf)
+        self._total_length += length
+
+    def remove(self, doc_id: int) -> None:
+        length = self._lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for t in self._doc_terms.pop(doc_id):
+            docs = self._postings[t]
+            del docs[doc_id]
+            if not docs:
+                del self._postings[t]
+
+    def search(self, query: str, k: int | None = 10) -> list[tuple[int, float]]:
+        """(doc id, score) of the best `k` documents (all matches if None), best first."""
+        n = len(self._lengths)
+        if not n:
+            return []
+        avgdl = self._total_length / n or 1.0
+        scores: dict[int, float] = {}
+        for t in set(tokenize(query)):
+            docs = self._postings.get(t)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, freq in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked if k is None else ranked[:k]
+
+
+def _fields(product, metal) -> dict[str, str]:
+    return {
+        "name": product.name or "",
+        "description": product.description or "",
+        "metal": metal.metal if metal else "",
+        "karat": metal.karat if metal else "",
+    }
+
+
+class ProductRetriever:
+    """Owns the index; applies committed product changes lazily before each search."""
+
+    def __init__(self, max_age: float = RETRIEVAL_MAX_AGE):
+        self.max_age = max_age
+        self._index: BM25Index | None = None
+        self._built_at = 0.0
+        self._pending: set[int] = set()
+        self._rebuild = False
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+        self.updates = 0
+        self.searches = 0
+
+    def build(self) -> None:
+        """(Re)build the index from the database (blocking)."""
+        db = SessionLocal()
+        try:
+            metals = {m.id: m for m in db.query(Metal).all()}
+            rows = db.query(Product.id, Product.name, Product.description, Product.metal_id).all()
+        finally:
+            db.close()
+        index = BM25Index()
+        for row in rows:
+            index.add(row.id, _fields(row, metals.get(row.metal_id)))
+        with self._lock:
+            self._index = index
+            self._built_at = time.monotonic()
+            self.rebuilds += 1
+
+    def mark_changed(self, product_ids: set[int], rebuild: bool = False) -> None:
+        with self._lock:
+            self._pending |= product_ids
+            self._rebuild = self._rebuild or rebuild
+
+    def _refresh(self) -> None:
+        with self._lock:
+            stale = self._index is None or self._rebuild or time.monotonic() - self._built_at > self.max_age
+            pending, self._pending = self._pending, set()
+            self._rebuild = False
+        if stale:
+            self.build()
+            return
+        if not pending:
+            return
+        db = SessionLocal()
+        try:
+            rows = {
+                p.id: p for p in db.query(Product).options(joinedload(Product.metal_info))
+                .filter(Product.id.in_(pending)).all()
+            }
+            with self._lock:
+                for product_id in pending:
+                    product = rows.get(product_id)
+                    if product is None:
+                        self._index.remove(product_id)
+                    else:
+                        self._index.add(product_id, _fields(product, product.metal_info))
+                self.updates += len(pending)
+        finally:
+            db.close()
+
+    def search(self, query: str, k: int | None = 10) -> list[tuple[int, float]]:
+        """Best products for a free-text description as (product id, score); blocking on first use."""
+        self._refresh()
+        self.searches += 1
+        with self._lock:
+            return self._index.search(query, k)
+
+    def stats(self) -> dict:
+        index = self._index
+        return {
+            "documents": len(index) if index else 0,
+            "terms": index.term_count if index else 0,
+            "pending_updates": len(self._pending),
+            "age_seconds": round(time.monotonic() - self._built_at, 1) if index else None,
+            "rebuilds": self.rebuilds,
+            "incremental_updates": self.updates,
+            "searches": self.searches,
+        }
+
+
+product_retriever = ProductRetriever()
+
+
+# Collect ids of products written in a session; apply them once the transaction commits
+@event.listens_for(Product, "after_insert")
+@event.listens_for(Product, "after_update")
+@event.listens_for(Product, "after_delete")
+def _product_written(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("retrieval_ids", set()).add(target.id)
+
+
+@event.listens_for(Metal, "after_update")
+def _metal_written(mapper, connection, target):
+    """Only the metal name and karat are indexed; a rate change needs no rebuild."""
+    attrs = inspect(target).attrs
+    session = object_session(target)
+    if session is not None and (attrs.metal.history.has_changes() or attrs.karat.history.has_changes()):
+        session.info["retrieval_rebuild"] = True
+
+
+@event.listens_for(Metal, "after_delete")
+def _metal_deleted(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info["retrieval_rebuild"] = True
+
+
+@event.listens_for(Session, "after_bulk_update")
+@event.listens_for(Session, "after_bulk_delete")
+def _bulk_written(update_context):
+    if update_context.mapper.class_ in (Product, Metal):
+        update_context.session.info["retrieval_rebuild"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_retrieval_changes(session):
+    ids = session.info.pop("retrieval_ids", set())
+    rebuild = session.info.pop("retrieval_rebuild", False)
+    if ids or rebuild:
+        product_retriever.mark_changed(ids, rebuild)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_retrieval_changes(session):
+    session.info.pop("retrieval_ids", None)
+    session.info.pop("retrieval_rebuild", None)
@@ -1,24 +1,13 @@
 from dotenv import load_dotenv
-import os
-import requests
 from db.models import get_db, Group
+from whatsapp_client import send_message, send_message_sync
 
 load_dotenv()
 
-token = os.getenv("ACCESS_TOKEN")
-version = os.getenv("VERSION")
-number_id = os.getenv("PHONE_NUMBER_ID")
 # user = input("Enter the recipient's phone number (with country code, e.g., +1234567890): ")
 
 ############# FOR SENDING MESSAGES MANUALLY #############
 def send_txt_msg():
-    url = f"https://graph.facebook.com/v24.0/{number_id}/messages"
-
-    headers = {
-        "Authorization" : f"Bearer {token}",
-        "Content-type": "application/json"
-    }
-
     data = {
         "messaging_product": "whatsapp",
         "recipient_type": "individual",
@@ -30,7 +19,7 @@ def send_txt_msg():
         }
     }
     
-    response = requests.post(url=url, headers=headers, json=data)
+    response = send_message_sync(data)
     return response
 
 def send_group_messages(group_id: int, message_text: str):
@@ -64,12 +53,6 @@ def send_group_messages(group_id: int, message_text: str):
             "details": []
         }
         
-        url = f"https://graph.facebook.com/{version}/{number_id}/messages"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-type": "application/json"
-        }
-        
         # Send message to each lead in the group
         for lead in group.leads:
             data = {
@@ -83,7 +66,7 @@ def send_group_messages(group_id: int, message_text: str):
             }
             
             try:
-                response = requests.post(url=url, headers=headers, json=data)
+                response = send_message_sync(data)
                 
                 if response.status_code == 200:
                     results["successful"] += 1
@@ -129,13 +112,6 @@ def send_group_messages(group_id: int, message_text: str):
 
 
 def send_img(user_contact_number: str, link: str, caption: str): #JPG.JPEG,PNG
-    url = f"https://graph.facebook.com/{version}/{number_id}/messages"
- 
-    headers = {
-        "Authorization" : f"Bearer {token}",
-        "Content-type": "application/json"
-    }
- 
     data = {
         "messaging_product": "whatsapp",
         "recipient_type": "individual",
@@ -147,9 +123,25 @@ def send_img(user_contact_number: str, link: str, caption: str): #JPG.JPEG,PNG
         }
     }
  
-    response = requests.post(url=url, headers=headers, json=data)
+    response = send_message_sync(data)
     return response
 
+
+async def send_img_async(user_contact_number: str, link: str, caption: str):
+    """Non-blocking send_img() for the async assistant pipeline."""
+    data = {
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "to": user_contact_number,
+        "type": "image",
+        "image": {
+            "link": link,
+            "caption": caption
+        }
+    }
+
+    return await send_message(data)
+
 # print(send_img(user))
 
 
@@ -186,12 +178,6 @@ def send_template_to_group(group_id: int, template_name: str, language_code: str
             "details": []
         }
         
-        url = f"https://graph.facebook.com/{version}/{number_id}/messages"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-type": "application/json"
-        }
-        
         # Send template message to each lead in the group
         for lead in group.leads:
             data = {
@@ -207,7 +193,7 @@ def send_template_to_group(group_id: int, template_name: str, language_code: str
             }
             
             try:
-                response = requests.post(url=url, headers=headers, json=data)
+                response = send_message_sync(data)
                 
                 if response.status_code == 200:
                     results["successful"] += 1
@@ -0,0 +1,129 @@
+"""
+Batched storage of WhatsApp delivery receipts.
+
+Most webhook deliveries are `statuses` updates (sent / delivered / read). They
+are buffered in memory and written to message_statuses in one bulk INSERT per
+flush, so a status storm after a broadcast costs a list append per receipt.
+"""
+import asyncio
+import os
+from datetime import datetime
+
+from dotenv import load_dotenv
+from sqlalchemy import insert
+
+from db.models import MessageStatus, SessionLocal
+
+load_dotenv()
+
+STATUS_FLUSH_INTERVAL = float(os.getenv("STATUS_FLUSH_INTERVAL", 2))
+STATUS_FLUSH_SIZE = int(os.getenv("STATUS_FLUSH_SIZE", 500))
+# Hard cap on buffered receipts if the DB is unavailable; the oldest are dropped beyond it
+STATUS_BUFFER_MAX = int(os.getenv("STATUS_BUFFER_MAX", 50000))
+
+
+def status_rows(value: dict) -> list[dict]:
+    """Turn the `statuses` list of one webhook change value into message_statuses rows."""
+    rows = []
+    for status in value.get("statuses") or []:
+        timestamp = status.get("timestamp")
+        rows.append({
+            "message_id": status.get("id"),
+            "recipient_id": status.get("recipient_id"),
+            "status": status.get("status"),
+            "status_at": datetime.utcfromtimestamp(int(timestamp)) if timestamp else None,
+            "errors": status.get("errors"),
+            "created_at": datetime.utcnow(),
+        })
+    return [row for row in rows if row["message_id"]]
+
+
+def _insert_rows(rows: list[dict]) -> None:
+    db = SessionLocal()
+    try:
+        db.execute(insert(MessageStatus), rows)
+        db.commit()
+    finally:
+        db.close()
+
+
+class StatusBuffer:
+    """In-memory receipt buffer flushed every `interval` seconds or once `flush_size` rows pile up."""
+
+    def __init__(
+        self,
+        interval: float = STATUS_FLUSH_INTERVAL,
+        flush_size: int = STATUS_FLUSH_SIZE,
+        max_size: int = STATUS_BUFFER_MAX,
+    ):
+        self.interval = interval
+        self.flush_size = flush_size
+        self.max_size = max_size
+        self._rows: list[dict] = []
+        self._task: asyncio.Task | None = None
+        self._wake: asyncio.Event | None = None
+
+        self.received = 0
+        self.written = 0
+        self.flushes = 0
+        self.dropped = 0
+
+    def add(self, rows: list[dict]) -> None:
+        if not rows:
+            return
+        self._rows.extend(rows)
+        self.received += len(rows)
+        overflow = len(self._rows) - self.max_size
+        if overflow > 0:
+            del self._rows[:overflow]
+            self.dropped += overflow
+        if len(self._rows) >= self.flush_size and self._wake is not None:
+            self._wake.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="status-flusher")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Write everything buffered so far in one bulk INSERT. Rows are kept on failure."""
+        if not self._rows:
+            return 0
+        rows, self._rows = self._rows, []
+        try:
+            await asyncio.to_thread(_insert_rows, rows)
+        except Exception as e:
+            print(f"Failed to flush {len(rows)} message status(es): {e!r}")
+            self._rows[:0] = rows
+            return 0
+        self.written += len(rows)
+        self.flushes += 1
+        return len(rows)
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._rows),
+            "received": self.received,
+            "written": self.written,
+            "flushes": self.flushes,
+            "dropped": self.dropped,
+        }
+
+
+status_buffer = StatusBuffer()
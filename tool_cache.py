@@ -0,0 +1,103 @@
+"""
+Cache of serialized product-tool results.
+
+Many customers trigger the same calls (get_products_by_metal("Gold"),
+get_products_by_metal_karat("22K"), ...). Results are keyed on the tool name and
+its normalized arguments and tagged with the catalog version: any committed
+product or metal change (including a rate_per_gram update) bumps the version and
+empties the cache. Memory is bounded by the total size of the cached strings,
+evicting least recently used entries; TOOL_CACHE_TTL bounds staleness when other
+processes edit the catalog.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TOOL_CACHE_MAX_BYTES = int(os.getenv("TOOL_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+TOOL_CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", 300))
+
+
+class ToolResultCache:
+    """LRU of tool output strings, bounded by total characters, valid for one catalog version."""
+
+    def __init__(self, max_bytes: int = TOOL_CACHE_MAX_BYTES, ttl: float = TOOL_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.version: int | None = None
+        self._entries: OrderedDict[Hashable, tuple[float, str]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self, version: int) -> None:
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self.version = version
+
+    def get(self, key: Hashable, version: int) -> str | None:
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, version: int, value: str) -> None:
+        """Store a result computed at `version`; ignored if the catalog moved on meanwhile."""
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if version != self.version:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def _drop(self, key: Hashable) -> None:
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "catalog_version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+tool_cache = ToolResultCache()
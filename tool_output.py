@@ -0,0 +1,54 @@
+"""
+Serialization of tool results sent back to the model.
+
+"json" (default) is the plain json.dumps of the result. "compact" writes product
+listings as a table: one `key=value` summary line, a header row of field names and
+one pipe-separated row per product. Keys are not repeated per product, columns that
+are empty on every row are dropped, and floats are rounded. Other results (errors,
+send_product_image) stay JSON. `python -m benchmarks.tool_output_format` compares
+size and speed of both.
+"""
+import json
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TOOL_OUTPUT_FORMAT = os.getenv("TOOL_OUTPUT_FORMAT", "json")
+TOOL_OUTPUT_DECIMALS = int(os.getenv("TOOL_OUTPUT_DECIMALS", 2))
+
+_SEPARATOR = "|"
+
+
+def _cell(value, decimals: int) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float):
+        value = round(value, decimals)
+        return str(int(value)) if value.is_integer() else str(value)
+    # Keep one product per line and the column count intact
+    return str(value).replace("\n", " ").replace(_SEPARATOR, "/")
+
+
+def encode_compact(out: dict, decimals: int = TOOL_OUTPUT_DECIMALS) -> str:
+    """Encode a product listing ({"products": [...], "total", "next_cursor"}) as a table."""
+    products = out["products"]
+    summary = " ".join(f"{k}={v}" for k, v in out.items() if k != "products" and v is not None)
+    fields = [f for f in (products[0] if products else ()) if any(p.get(f) is not None for p in products)]
+    lines = [summary]
+    if fields:
+        lines.append(_SEPARATOR.join(fields))
+    lines.extend(_SEPARATOR.join(_cell(p.get(f), decimals) for f in fields) for p in products)
+    return "\n".join(lines)
+
+
+def encode_tool_output(out, output_format: str = TOOL_OUTPUT_FORMAT) -> str:
+    """Serialize a tool result for a function_call_output item."""
+    if output_format == "compact":
+        if isinstance(out, dict) and isinstance(out.get("products"), list):
+            return encode_compact(out)
+        return json.dumps(out, default=str, separators=(",", ":"))
+    return json.dumps(out, default=str)
@@ -0,0 +1,147 @@
+"""
+Per-turn tool subset selection and input-token accounting.
+
+Every Responses API call carries the tool schemas. A keyword pre-classification
+of the customer's message picks the tool groups the turn can need (product
+codes, browsing, filters, images, store information); the tools are then taken
+from the canonical list in its original order and the developer instruction is
+left untouched, so each distinct subset is a byte-stable prefix that
+provider-side prompt caching can reuse. Messages with no clear signal, and
+follow-ups that point back into the conversation ("is it available?", "price of
+the second one"), whose product only the earlier turns name, keep the full tool
+set. Estimated schema tokens (full vs trimmed) and the API's reported input /
+cached tokens are recorded per turn.
+"""
+import json
+import os
+import re
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TOOL_TRIMMING = os.getenv("TOOL_TRIMMING", "1") == "1"
+
+_PRODUCT_LOOKUP = ("search_products", "lookup_product_code")
+_BROWSE = ("get_all_products", "get_products_by_name", "search_products", "find_products")
+
+# group -> (trigger, tools it needs)
+TOOL_GROUPS = {
+    "codes": (
+        re.compile(r"\b(?=[a-z\-/]*\d)(?=\d*[a-z])[a-z0-9\-/]{4,}\b", re.IGNORECASE),
+        _PRODUCT_LOOKUP,
+    ),
+    "images": (
+        re.compile(r"\b(photo|photos|pic|pics|picture|pictures|image|images|img|see|look)\b", re.IGNORECASE),
+        ("send_product_image", "get_products_by_name", "find_products") + _PRODUCT_LOOKUP,
+    ),
+    "filters": (
+        re.compile(
+            r"\b(gold|silver|platinum|diamond|\d{2}\s?(k|kt|karat|carat)|price|prices|cost|budget|under|below|"
+            r"above|between|cheap|cheapest|expensive|rs|inr|lakh|available|availability|stock)\b|₹",
+            re.IGNORECASE,
+        ),
+        ("get_products_by_metal", "get_products_by_metal_karat", "get_products_by_price",
+         "get_products_by_availability"),
+    ),
+    "browse": (
+        re.compile(
+            r"\b(rings?|chains?|necklaces?|bangles?|bracelets?|earrings?|pendants?|sets?|jewell?e?ry|"
+            r"designs?|collection|products?|items?|show|list|catalog|catalogue|looking|want|suggest|bridal)\b",
+            re.IGNORECASE,
+        ),
+        _BROWSE,
+    ),
+    "store": (
+        re.compile(
+            r"\b(return|returns|exchange|refund|policy|shipping|delivery|deliver|store|shop|address|location|"
+            r"timings?|hours|open|contact|brand|certificate|certified|hallmark|warranty|ridra)\b",
+            re.IGNORECASE,
+        ),
+        ("web_search",),
+    ),
+}
+
+# Back-references to products named earlier: the turn may need any tool to act on them
+_BACK_REFERENCE_RE = re.compile(
+    r"\b(it|its|this|that|these|those|them|they|one|ones|first|second|third|last|previous|above|same)\b",
+    re.IGNORECASE,
+)
+
+
+def tool_name(tool: dict) -> str:
+    return tool.get("name") or tool["type"]
+
+
+def select_tool_names(content: str) -> tuple[frozenset[str] | None, tuple[str, ...]]:
+    """(tool names the message may need, or None for all tools; matched groups)."""
+    if _BACK_REFERENCE_RE.search(content or ""):
+        return None, ()
+    groups = tuple(g for g, (pattern, _) in TOOL_GROUPS.items() if pattern.search(content or ""))
+    if not groups:
+        return None, ()
+    return frozenset(name for g in groups for name in TOOL_GROUPS[g][1]), groups
+
+
+def select_tools(tools: list[dict], content: str) -> tuple[list[dict], tuple[str, ...]]:
+    """Subset of `tools` for this message, in the canonical order of `tools`."""
+    if not TOOL_TRIMMING:
+        return tools, ()
+    names, groups = select_tool_names(content)
+    if names is None:
+        return tools, ()
+    return [t for t in tools if tool_name(t) in names], groups
+
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("o200k_base")
+
+    def estimate_tokens(obj) -> int:
+        return len(_encoding.encode(json.dumps(obj, separators=(",", ":"))))
+except ImportError:
+    def estimate_tokens(obj) -> int:
+        return (len(json.dumps(obj, separators=(",", ":"))) + 3) // 4
+
+
+class TokenUsage:
+    """Per-turn tool-schema token estimates and the API's reported input tokens."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.trimmed_turns = 0
+        self.full_schema_tokens = 0
+        self.sent_schema_tokens = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.groups: dict[str, int] = {}
+
+    def record(self, groups: tuple[str, ...], full_tokens: int, sent_tokens: int, input_tokens: int, cached_tokens: int) -> None:
+        with self._lock:
+            self.turns += 1
+            self.trimmed_turns += sent_tokens < full_tokens
+            self.full_schema_tokens += full_tokens
+            self.sent_schema_tokens += sent_tokens
+            self.input_tokens += input_tokens
+            self.cached_tokens += cached_tokens
+            key = "+".join(groups) or "all"
+            self.groups[key] = self.groups.get(key, 0) + 1
+
+    def stats(self) -> dict:
+        turns = self.turns or 1
+        return {
+            "enabled": TOOL_TRIMMING,
+            "turns": self.turns,
+            "trimmed_turns": self.trimmed_turns,
+            "avg_schema_tokens_full": round(self.full_schema_tokens / turns, 1),
+            "avg_schema_tokens_sent": round(self.sent_schema_tokens / turns, 1),
+            "avg_input_tokens": round(self.input_tokens / turns, 1),
+            "avg_cached_tokens": round(self.cached_tokens / turns, 1),
+            "tool_sets": dict(self.groups),
+        }
+
+
+token_usage = TokenUsage()
@@ -1,79 +1,298 @@
-from fastapi import FastAPI, APIRouter, Request, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, Request, HTTPException
 from fastapi.responses import PlainTextResponse
 from starlette.middleware.sessions import SessionMiddleware
 import os
 from dotenv import load_dotenv
-import httpx
-from ai import chat_with_assistant
+import whatsapp_client
+from ai import chat_with_assistant, conversation_pool
 from pathlib import Path
 import sqladmin
 from fastapi.staticfiles import StaticFiles
 import shutil
-from db.models import Base, engine, get_db, Lead
+from db.models import Base, engine, SessionLocal, Lead, insert_missing_leads, init_async_engine, dispose_async_engine, ensure_product_amount
 from sqlalchemy.orm import Session
+from db.search import ensure_search_index
+from ingest import IngestQueue, SenderScheduler, INGEST_MODE
+from dedup import deduplicator
+from lead_cache import lead_cache, CachedLead
+from statuses import status_buffer, status_rows
+from catalog import catalog, CATALOG_SNAPSHOT
+from tool_cache import tool_cache
+from intents import intent_router
+from answer_cache import answer_cache
+from retrieval import product_retriever
+from tool_selection import token_usage
+from contextlib import asynccontextmanager
+import asyncio
+import json
 
 load_dotenv()
 
 router = APIRouter()
 
 VERIFY_TOKEN = os.getenv("VERIFY_TOKEN")
-ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
-VERSION = os.getenv("VERSION")
 PORT = int(os.getenv("PORT", 8000))
 
 
 static_path = Path("static")
 static_path.mkdir(exist_ok=True)
 
-@router.post("/webhook")
-async def webhook(request: Request, db: Session = Depends(get_db)):
-    body = await request.json()
-    contact = (
-    body.get("entry", [{}])[0]
-        .get("changes", [{}])[0]
-        .get("value", {})
-        .get("contacts", [{}])[0]
-)
-    wa_id = contact.get("wa_id")
-    name = contact.get("profile", {}).get("name")
-    print("Incoming webhook message:", body)
-    print("User Number", wa_id, "User Name", name)
-    if db.query(Lead).filter(Lead.phone == wa_id).first() is None and wa_id is not None:
-        from openai import OpenAI
-        openai_client = OpenAI()
-        # Responses API: one conversation per lead (stored in thread_id)
-        new_conv = openai_client.conversations.create()
-        new_lead = Lead(phone=wa_id, name=name, thread_id=new_conv.id)
-        db.add(new_lead)
+def _iter_change_values(body: dict):
+    """Yield every change value in a webhook payload (Meta batches several entries/changes)."""
+    for entry in body.get("entry") or []:
+        for change in entry.get("changes") or []:
+            yield change.get("value") or {}
+
+
+def _upsert_leads(db: Session, contacts: dict[str, str | None]) -> dict[str, CachedLead]:
+    """
+    Resolve every lead for `contacts` (wa_id -> profile name): cached senders cost nothing,
+    the rest are fetched in one query and the missing ones created in one commit.
+    """
+    leads: dict[str, CachedLead] = {}
+    misses = []
+    for wa_id in contacts:
+        cached = lead_cache.get(wa_id)
+        if cached is not None:
+            leads[wa_id] = cached
+        else:
+            misses.append(wa_id)
+    if not misses:
+        return leads
+
+    rows = db.query(Lead.id, Lead.phone, Lead.thread_id).filter(Lead.phone.in_(misses)).all()
+    for row in rows:
+        leads[row.phone] = CachedLead(row.id, row.phone, row.thread_id)
+    missing = [wa_id for wa_id in misses if wa_id not in leads]
+    if missing:
+        new_rows = []
+        for wa_id in missing:
+            # Responses API: one conversation per lead (stored in thread_id). Take a pre-warmed one
+            # if available; otherwise chat_with_assistant creates it lazily, so the insert never waits.
+            new_rows.append({"phone": wa_id, "name": contacts[wa_id], "thread_id": conversation_pool.take()})
+        # One INSERT for all new senders; a concurrent worker inserting the same wa_id is ignored
+        insert_missing_leads(db, new_rows)
         db.commit()
-        print(f"New lead created with wa_id: {wa_id}, conversation_id={new_conv.id}")
+        rows = db.query(Lead.id, Lead.phone, Lead.thread_id).filter(Lead.phone.in_(missing)).all()
+        for row in rows:
+            leads[row.phone] = CachedLead(row.id, row.phone, row.thread_id)
+            print(f"New lead created with wa_id: {row.phone}, conversation_id={row.thread_id}")
+    for wa_id in misses:
+        if wa_id in leads:
+            lead_cache.put(leads[wa_id])
+    return leads
+
+
+def _release_claims(message_ids: list[str | None]) -> None:
+    db = SessionLocal()
+    try:
+        deduplicator.release(db, message_ids)
+    finally:
+        db.close()
 
-    message = body.get("entry", [{}])[0].get("changes", [{}])[0].get("value", {}).get("messages", [{}])[0]
 
-    if message.get("type") == "text":
-        business_phone_number_id = body.get("entry", [{}])[0].get("changes", [{}])[0].get("value", {}).get("metadata", {}).get("phone_number_id")
-        content = message["text"]["body"]
-        lead = db.query(Lead).filter(Lead.phone == wa_id).first()
-        response_gpt = chat_with_assistant(lead.id, content) if lead else chat_with_assistant(None, content)
+async def _reply_to_message(lead: CachedLead | None, messages: list[dict], business_phone_number_id: str | None) -> None:
+    """
+    Run the assistant for one or more consecutive text messages and reply to the last one.
+    If that fails the message ids are released, so Meta's redelivery is answered.
+    """
+    try:
+        content = "\n".join(m["text"]["body"] for m in messages)
+        response_gpt = await chat_with_assistant(lead, content)
         print(response_gpt, 'xyz')
 
+        last = messages[-1]
         reply_data = {
             "messaging_product": "whatsapp",
-            "to": message["from"],
+            "to": last["from"],
             "text": {"body": response_gpt},
-            "context": {"message_id": message["id"]},
+            "context": {"message_id": last["id"]},
         }
 
-        async with httpx.AsyncClient() as client:
-            await client.post(
-                f"https://graph.facebook.com/{VERSION}/{business_phone_number_id}/messages",
-                headers={"Authorization": f"Bearer {ACCESS_TOKEN}"},
-                json=reply_data
-            )
+        await whatsapp_client.send_message(reply_data, business_phone_number_id)
+    except Exception:
+        await asyncio.to_thread(_release_claims, [m.get("id") for m in messages])
+        raise
+
+
+def _merge_reply_jobs(jobs: list[tuple]) -> tuple:
+    """Fold a burst of one sender's messages into a single assistant turn."""
+    lead, _, business_phone_number_id = jobs[-1]
+    return lead, [m for _, messages, _ in jobs for m in messages], business_phone_number_id
+
+
+sender_scheduler = SenderScheduler(lambda job: _reply_to_message(*job), merge=_merge_reply_jobs)
+
+
+def _prepare_jobs(contacts: dict[str, str | None], messages: list[tuple[dict, str | None]]) -> list[tuple]:
+    """Resolve the senders' leads and claim the message ids; one reply job per new text message."""
+    db = SessionLocal()
+    try:
+        leads = _upsert_leads(db, contacts)
+
+        # Meta retries deliveries: never run the assistant twice for one message id
+        fresh_ids = deduplicator.claim_many(db, [m.get("id") for m, _ in messages])
+    finally:
+        db.close()
+
+    jobs = []
+    for message, business_phone_number_id in messages:
+        if message.get("id") not in fresh_ids:
+            print(f"Duplicate delivery of message {message.get('id')}, skipping")
+            continue
+        if message.get("type") != "text":
+            continue
+        jobs.append((leads.get(message.get("from")), [message], business_phone_number_id))
+    return jobs
+
+
+async def process_webhook(body: dict) -> bool:
+    """
+    Run the lead / assistant / reply pipeline for every message in one webhook payload.
+    Returns False if a message was dropped or (inline mode) its reply failed; its id is released.
+    """
+    print("Incoming webhook message:", body)
+    contacts: dict[str, str | None] = {}
+    messages: list[tuple[dict, str | None]] = []
+    for value in _iter_change_values(body):
+        business_phone_number_id = (value.get("metadata") or {}).get("phone_number_id")
+        for contact in value.get("contacts") or []:
+            wa_id = contact.get("wa_id")
+            if wa_id:
+                contacts[wa_id] = (contact.get("profile") or {}).get("name")
+                print("User Number", wa_id, "User Name", contacts[wa_id])
+        for message in value.get("messages") or []:
+            messages.append((message, business_phone_number_id))
+            if message.get("from"):
+                contacts.setdefault(message["from"], None)
+        status_buffer.add(status_rows(value))
+    if not contacts and not messages:
+        return True
+
+    # Lead upsert and dedup claims are blocking DB work: keep them off the event loop
+    jobs = await asyncio.to_thread(_prepare_jobs, contacts, messages)
+
+    # Each sender's messages run in arrival order, different senders in parallel.
+    # The ids are already claimed, so wait for room rather than drop them when the scheduler is full
+    pending = []
+    dropped = []
+    for job in jobs:
+        message = job[1][0]
+        await sender_scheduler.wait_for_capacity()
+        done = sender_scheduler.submit(message.get("from"), job)
+        if done is None:
+            print(f"Sender {message.get('from')} has too many pending messages, dropping {message.get('id')}")
+            dropped.append(message.get("id"))
+        else:
+            pending.append(done)
+    if dropped:
+        await asyncio.to_thread(_release_claims, dropped)
+    if INGEST_MODE != "queue":
+        # Inline mode keeps the old contract: the reply is sent before we return 200
+        results = await asyncio.gather(*pending)
+        return not dropped and all(results)
+    return not dropped
+
+
+ingest_queue = IngestQueue(process_webhook)
+
+
+@router.post("/webhook")
+async def webhook(request: Request):
+    raw = await request.body()
+    if b'"messages"' not in raw and b'"contacts"' not in raw:
+        # Status-only delivery (sent/delivered/read receipts): buffer and ack, no lead/assistant path
+        body = json.loads(raw)
+        for value in _iter_change_values(body):
+            status_buffer.add(status_rows(value))
+        return PlainTextResponse('', status_code=200)
+
+    body = json.loads(raw)
+    if sender_scheduler.full:
+        # Backlog of unanswered messages is at SENDER_MAX_PENDING: let Meta redeliver later
+        return PlainTextResponse('', status_code=503)
+    if INGEST_MODE == "queue":
+        # Ack first: workers do the heavy lifting after Meta has its 200
+        if not ingest_queue.put(body):
+            # Queue is full: a non-2xx makes Meta redeliver later instead of us dropping the payload
+            return PlainTextResponse('', status_code=503)
+        return PlainTextResponse('', status_code=200)
 
+    if not await process_webhook(body):
+        # A reply failed or was dropped and its id released: a 500 makes Meta redeliver it
+        return PlainTextResponse('', status_code=500)
     return PlainTextResponse('', status_code=200)
 
 
+@router.get("/metrics/ingest")
+async def ingest_metrics():
+    scheduler = sender_scheduler.stats()
+    return {
+        **ingest_queue.stats(),
+        # In queue mode payloads leave the ingest queue at once; the messages wait here
+        "sender_pending_jobs": scheduler["pending_jobs"],
+        "sender_max_pending": scheduler["max_pending"],
+        "sender_queued_jobs": scheduler["queued_jobs"],
+        "sender_running": scheduler["running_senders"],
+        "sender_rejected": scheduler["rejected"],
+    }
+
+
+@router.get("/metrics/dedup")
+async def dedup_metrics():
+    return deduplicator.stats()
+
+
+@router.get("/metrics/senders")
+async def sender_metrics():
+    return sender_scheduler.stats()
+
+
+@router.get("/metrics/statuses")
+async def status_metrics():
+    return status_buffer.stats()
+
+
+@router.get("/metrics/leads")
+async def lead_cache_metrics():
+    return lead_cache.stats()
+
+
+@router.get("/metrics/conversations")
+async def conversation_pool_metrics():
+    return conversation_pool.stats()
+
+
+@router.get("/metrics/catalog")
+async def catalog_metrics():
+    return catalog.stats()
+
+
+@router.get("/metrics/tools")
+async def tool_cache_metrics():
+    return tool_cache.stats()
+
+
+@router.get("/metrics/intents")
+async def intent_metrics():
+    return intent_router.stats()
+
+
+@router.get("/metrics/answers")
+async def answer_cache_metrics():
+    return answer_cache.stats()
+
+
+@router.get("/metrics/retrieval")
+async def retrieval_metrics():
+    return product_retriever.stats()
+
+
+@router.get("/metrics/tokens")
+async def token_metrics():
+    return token_usage.stats()
+
+
 @router.get("/webhook")
 async def verify_webhook(request: Request):
     query_params = request.query_params
@@ -88,7 +307,31 @@ async def verify_webhook(request: Request):
         raise HTTPException(status_code=403, detail="Verification token mismatch.")
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_async_engine()
+    if INGEST_MODE == "queue":
+        ingest_queue.start()
+    await whatsapp_client.startup()
+    status_buffer.start()
+    conversation_pool.start()
+    # Warm the catalog snapshot and retrieval index; on failure they load on first use instead
+    try:
+        if CATALOG_SNAPSHOT:
+            await asyncio.to_thread(catalog.get)
+        await asyncio.to_thread(product_retriever.build)
+    except Exception as e:
+        print(f"Catalog warm-up failed, will retry on first use: {e!r}")
+    yield
+    await ingest_queue.stop()
+    await sender_scheduler.join()
+    await status_buffer.stop()
+    await conversation_pool.stop()
+    await whatsapp_client.shutdown()
+    await dispose_async_engine()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Add session middleware for flash messages in admin
 app.add_middleware(SessionMiddleware, secret_key="your-secret-key-here-change-in-production")
@@ -109,6 +352,8 @@ media_path.mkdir(exist_ok=True)
 app.mount("/media", StaticFiles(directory="media"), name="media")
 
 Base.metadata.create_all(bind=engine)
+ensure_product_amount(engine)
+ensure_search_index(engine)
 app.include_router(router)
 
 from sqladmin import Admin
@@ -0,0 +1,110 @@
+"""
+Shared, pooled HTTP client for the WhatsApp Cloud (Graph) API.
+
+Every outbound send goes through here so requests reuse keep-alive (HTTP/2 when
+`h2` is installed) connections to graph.facebook.com instead of paying for a new
+TCP + TLS handshake per message. The async client is created at app startup and
+closed at shutdown; blocking callers (scripts, the assistant's tool thread) share
+one pooled sync client.
+"""
+import os
+import threading
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GRAPH_API_URL = "https://graph.facebook.com"
+ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
+VERSION = os.getenv("VERSION")
+PHONE_NUMBER_ID = os.getenv("PHONE_NUMBER_ID")
+
+WA_HTTP2 = os.getenv("WA_HTTP2", "1") == "1"
+WA_MAX_CONNECTIONS = int(os.getenv("WA_MAX_CONNECTIONS", 100))
+WA_MAX_KEEPALIVE = int(os.getenv("WA_MAX_KEEPALIVE", 20))
+WA_KEEPALIVE_EXPIRY = float(os.getenv("WA_KEEPALIVE_EXPIRY", 30))
+WA_TIMEOUT = float(os.getenv("WA_TIMEOUT", 15))
+WA_CONNECT_TIMEOUT = float(os.getenv("WA_CONNECT_TIMEOUT", 5))
+
+_async_client: httpx.AsyncClient | None = None
+_sync_client: httpx.Client | None = None
+_sync_lock = threading.Lock()
+
+
+def _http2_enabled() -> bool:
+    if not WA_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _client_kwargs() -> dict:
+    return {
+        "http2": _http2_enabled(),
+        "limits": httpx.Limits(
+            max_connections=WA_MAX_CONNECTIONS,
+            max_keepalive_connections=WA_MAX_KEEPALIVE,
+            keepalive_expiry=WA_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(WA_TIMEOUT, connect=WA_CONNECT_TIMEOUT),
+        "headers": {
+            "Authorization": f"Bearer {ACCESS_TOKEN}",
+            "Content-type": "application/json",
+        },
+    }
+
+
+def messages_url(phone_number_id: str | None = None) -> str:
+    """Graph API messages endpoint for the given (or default) business phone number id."""
+    return f"{GRAPH_API_URL}/{VERSION}/{phone_number_id or PHONE_NUMBER_ID}/messages"
+
+
+async def startup() -> None:
+    """Create the shared async client (FastAPI startup)."""
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(**_client_kwargs())
+
+
+async def shutdown() -> None:
+    """Close pooled connections (FastAPI shutdown)."""
+    global _async_client, _sync_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    with _sync_lock:
+        if _sync_client is not None:
+            _sync_client.close()
+            _sync_client = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Shared async client; created lazily if used outside the app lifespan."""
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(**_client_kwargs())
+    return _async_client
+
+
+def get_sync_client() -> httpx.Client:
+    """Shared blocking client for scripts and code running in worker threads."""
+    global _sync_client
+    if _sync_client is None:
+        with _sync_lock:
+            if _sync_client is None:
+                _sync_client = httpx.Client(**_client_kwargs())
+    return _sync_client
+
+
+async def send_message(payload: dict, phone_number_id: str | None = None) -> httpx.Response:
+    """POST a message payload to the Graph API over the shared async pool."""
+    return await get_async_client().post(messages_url(phone_number_id), json=payload)
+
+
+def send_message_sync(payload: dict, phone_number_id: str | None = None) -> httpx.Response:
+    """Blocking variant of send_message() over the shared sync pool."""
+    return get_sync_client().post(messages_url(phone_number_id), json=payload)